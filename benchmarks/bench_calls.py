@@ -0,0 +1,37 @@
+"""Show that the cost of a function call does not depend on how many functions are defined.
+
+Run from the repository root:
+
+    py -m benchmarks.bench_calls
+"""
+import time
+
+from interpreter import Interpreter
+from lexer import Lexer
+from parserR import Parser
+
+CALLS = 20000
+
+
+def parse(text):
+    return Parser(Lexer(text)).parse()
+
+
+def per_call_time(n_globals):
+    interpreter = Interpreter()
+    definitions = '\n'.join(f'Defun {{ f{i}, (x) }} x + {i}' for i in range(n_globals))
+    interpreter.interpret(parse(definitions + '\nDefun { add, (x, y) } x + y'))
+    call = parse('add(1, 2)')[0]
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        interpreter.visit(call)
+    return (time.perf_counter() - start) / CALLS
+
+
+def main():
+    for n_globals in (10, 100, 1000, 10000):
+        print(f"{n_globals:>6} globals: {per_call_time(n_globals) * 1e6:7.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
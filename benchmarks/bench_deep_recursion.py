@@ -0,0 +1,76 @@
+"""Compare the recursive tree walker with the explicit-stack evaluator on deep non-tail recursion.
+
+Run from the repository root:
+
+    py -m benchmarks.bench_deep_recursion
+
+Every measurement runs in a fresh child process so that its peak resident
+memory can be reported; tracemalloc is far too slow on million-frame stacks.
+"""
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+from interpreter import Interpreter
+from lexer import Lexer
+from parserR import Parser
+from stack_eval import StackInterpreter
+
+PROGRAM = "Defun { total, (n) } if (n == 0) { 0 } else { n + total(n - 1) }"
+DEPTHS = (1000, 10000, 100000)
+ENGINES = {
+    'recursive visitor': Interpreter,
+    'explicit stack': StackInterpreter,
+}
+
+
+def evaluate(engine, depth):
+    interpreter = engine()
+    interpreter.interpret(Parser(Lexer(PROGRAM)).parse())
+    call = Parser(Lexer(f"total({depth})")).parse()
+    interpreter.resolve(call)
+    start = time.perf_counter()
+    result = interpreter.visit(call[0])
+    elapsed = time.perf_counter() - start
+    assert result == depth * (depth + 1) // 2
+    return elapsed
+
+
+def child(engine_name, depth):
+    # The recursive visitor needs a raised recursion limit and a large C stack
+    # to get anywhere near these depths; run it in a thread that has one.
+    outcome = []
+
+    def run():
+        try:
+            outcome.append(f"{depth / evaluate(ENGINES[engine_name], depth):10.0f} calls/s")
+        except RecursionError:
+            outcome.append("RecursionError")
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20 * depth + 1000))
+    threading.stack_size(1024 * 1024 * 1024)
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{outcome[0] if outcome else 'crashed'}, peak RSS {peak_mb:7.1f} MB")
+
+
+def main():
+    for depth in DEPTHS:
+        print(f"depth {depth}:")
+        for engine_name in ENGINES:
+            completed = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_deep_recursion', '--child', engine_name, str(depth)],
+                capture_output=True, text=True)
+            report = completed.stdout.strip() or f"crashed (exit code {completed.returncode})"
+            print(f"  {engine_name:>17}: {report}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
@@ -0,0 +1,51 @@
+"""Stress the lexer with ~10 MB of whitespace and comments.
+
+Run from the repository root:
+
+    py -m benchmarks.bench_lexer_whitespace
+"""
+import sys
+import time
+
+from lexer import Lexer, TokenType
+
+TARGET_SIZE = 10 * 1024 * 1024
+
+
+def make_blank_region(kind, size=TARGET_SIZE):
+    if kind == 'spaces':
+        return ' ' * size
+    if kind == 'newlines':
+        return '\n' * size
+    if kind == 'indented':
+        return ('\t' + ' ' * 30 + '\n') * (size // 32)
+    if kind == 'comments':
+        line = '# ' + 'x' * 60 + '\n'
+        return line * (size // len(line))
+    if kind == 'mixed':
+        chunk = '   \n\t# a comment line\n\n    # another one\n' + ' ' * 20 + '\n'
+        return chunk * (size // len(chunk))
+    raise ValueError(kind)
+
+
+def bench(kind):
+    text = '1 +' + make_blank_region(kind) + '2 # trailing comment'
+    lexer = Lexer(text)
+    start = time.perf_counter()
+    tokens = [(token.type, token.value) for token in lexer.tokenize()]
+    elapsed = time.perf_counter() - start
+    expected = [(TokenType.INTEGER, 1), (TokenType.PLUS, '+'), (TokenType.INTEGER, 2), (TokenType.EOF, None)]
+    assert tokens == expected, tokens
+    return len(text), elapsed
+
+
+def main():
+    limit = sys.getrecursionlimit()
+    for kind in ('spaces', 'newlines', 'indented', 'comments', 'mixed'):
+        size, elapsed = bench(kind)
+        print(f"{kind:>10}: {size / 1e6:6.1f} MB in {elapsed:.3f}s ({size / 1e6 / elapsed:8.1f} MB/s)")
+    assert sys.getrecursionlimit() == limit
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Compare Interpreter.map_function on NumPy columns with calling the function row by row.
+
+Run from the repository root (needs NumPy):
+
+    py -m benchmarks.bench_map_function
+"""
+import time
+
+from interpreter import Interpreter
+from lexer import Lexer
+from parserR import Parser
+from vectorize import load_numpy
+
+ROWS = 1_000_000
+LOOP_ROWS = 20_000  # the row by row time is measured on this many rows and scaled up
+
+PROGRAM = """
+Defun { score, (x, y) } if (x % 3 == 0 && y > 10) { x * 2 + y } else { x - y / 2 }
+Defun { score_call, (x, y) } score(x, y)
+"""
+
+
+def main():
+    np = load_numpy()
+    if np is None:
+        print("NumPy is not installed; map_function calls every function row by row")
+        return
+    interpreter = Interpreter()
+    interpreter.interpret(Parser(Lexer(PROGRAM)).parse())
+    x = np.arange(ROWS, dtype=np.int64)
+    y = x % 50
+
+    start = time.perf_counter()
+    vectorized = interpreter.map_function('score', [x, y])
+    vectorized_s = time.perf_counter() - start
+
+    # A body with a call is not vectorized, so this runs the per-row loop
+    start = time.perf_counter()
+    looped = interpreter.map_function('score_call', [x[:LOOP_ROWS], y[:LOOP_ROWS]])
+    loop_s = (time.perf_counter() - start) * ROWS / LOOP_ROWS
+
+    assert (vectorized[:LOOP_ROWS] == looped).all()
+    print(f"vectorized: {ROWS / vectorized_s:>14,.0f} rows/s")
+    print(f"row by row: {ROWS / loop_s:>14,.0f} rows/s ({loop_s / vectorized_s:.0f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
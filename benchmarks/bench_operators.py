@@ -0,0 +1,108 @@
+"""Time each operator of operators.py in every execution engine.
+
+Run from the repository root:
+
+    py -m benchmarks.bench_operators
+
+Each operator is timed as a function body applying it CHAIN times, as in
+x + y + y + ... or !!!x, minus the time of a call whose body only returns
+x, and divided by CHAIN. The calls are made with each engine's
+call_function(). The 'chain' column is the tree interpreter dispatching with the if/elif chain
+it used before the operator registry, for comparison.
+
+A difference smaller than the spread of the timings of that returning call
+is below what the benchmark can measure; it is printed as measured, which
+may be negative, and marked with '*'.
+"""
+import time
+
+from interpreter import Interpreter
+from lexer import Lexer, TokenType
+from main import ENGINES
+from operators import OPERATORS
+from parserR import Parser
+
+CALLS = 2000
+CHAIN = 50  # operator applications per call
+REPEAT = 5
+
+
+class ChainInterpreter(Interpreter):
+    """The tree interpreter with its earlier operator dispatch."""
+
+    def visit_BinaryOp(self, node):
+        if node.op.type == TokenType.PLUS:
+            return self.visit(node.left) + self.visit(node.right)
+        elif node.op.type == TokenType.MINUS:
+            return self.visit(node.left) - self.visit(node.right)
+        elif node.op.type == TokenType.MULTIPLY:
+            return self.visit(node.left) * self.visit(node.right)
+        elif node.op.type == TokenType.DIVIDE:
+            return self.visit(node.left) // self.visit(node.right)
+        elif node.op.type == TokenType.MODULO:
+            return self.visit(node.left) % self.visit(node.right)
+        elif node.op.type == TokenType.AND:
+            return self.visit(node.left) and self.visit(node.right)
+        elif node.op.type == TokenType.OR:
+            return self.visit(node.left) or self.visit(node.right)
+        elif node.op.type == TokenType.EQUAL:
+            return self.visit(node.left) == self.visit(node.right)
+        elif node.op.type == TokenType.NOT_EQUAL:
+            return self.visit(node.left) != self.visit(node.right)
+        elif node.op.type == TokenType.GREATER_THAN:
+            return self.visit(node.left) > self.visit(node.right)
+        elif node.op.type == TokenType.LESS_THAN:
+            return self.visit(node.left) < self.visit(node.right)
+        elif node.op.type == TokenType.GREATER_THAN_OR_EQUAL:
+            return self.visit(node.left) >= self.visit(node.right)
+        elif node.op.type == TokenType.LESS_THAN_OR_EQUAL:
+            return self.visit(node.left) <= self.visit(node.right)
+        else:
+            raise Exception(f'Invalid operator {node.op}')
+
+    def visit_UnaryOp(self, node):
+        if node.op.type == TokenType.NOT:
+            return not self.visit(node.expr)
+        else:
+            raise Exception(f'Invalid operator {node.op}')
+
+
+ENGINES_TIMED = dict(ENGINES, chain=ChainInterpreter)
+
+
+def parse(text):
+    return Parser(Lexer(text)).parse()
+
+
+def call_times(engine, body):
+    """Return the time of one call of a function with this body in each of REPEAT runs, fastest first."""
+    interpreter = engine()
+    interpreter.interpret(parse(f"Defun {{ f, (x, y) }} {body}"))
+    # call_function() rather than a top-level call, which the python engine compiles every time
+    func, args, call_function = interpreter.env['f'], [7, 3], interpreter.call_function
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for _ in range(CALLS):
+            call_function(func, args)
+        times.append((time.perf_counter() - start) / CALLS)
+    return sorted(times)
+
+
+def main():
+    print(f"{'operator':<10}" + ''.join(f"{name:>10}" for name in ENGINES_TIMED) + "   (ns per application)")
+    baselines = {name: call_times(engine, 'x') for name, engine in ENGINES_TIMED.items()}
+    for op in OPERATORS.values():
+        body = 'x' + f' {op.symbol} y' * CHAIN if op.arity == 2 else op.symbol * CHAIN + 'x'
+        cells = []
+        for name, engine in ENGINES_TIMED.items():
+            baseline = baselines[name]
+            difference = call_times(engine, body)[0] - baseline[0]
+            marker = '*' if difference < baseline[-1] - baseline[0] else ' '
+            cells.append(f"{round(difference / CHAIN * 1e9):>9}{marker}")
+        print(f"{op.symbol:<10}" + ''.join(cells))
+    print("* below the noise of the timings")
+
+
+if __name__ == "__main__":
+    main()
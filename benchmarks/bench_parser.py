@@ -0,0 +1,128 @@
+"""Compare the table-driven expression parser with the recursive descent it replaced.
+
+Run from the repository root:
+
+    py -m benchmarks.bench_parser
+
+LegacyParser keeps the old one-method-per-level parser, which needs several
+Python calls per operand and recurses on every '(' and '!'. The input is
+lexed beforehand, so only parsing is timed.
+"""
+import gc
+import sys
+import time
+
+from lexer import Lexer, TokenType
+from parserR import Boolean, BinaryOp, Number, Parser, UnaryOp, Variable
+
+from benchmarks.suite import TokenReplay
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+
+class LegacyParser(Parser):
+    def factor(self):
+        token = self.current_token
+        if token.type == TokenType.INTEGER:
+            self.eat(TokenType.INTEGER)
+            return Number(token.value)
+        elif token.type == TokenType.BOOLEAN:
+            self.eat(TokenType.BOOLEAN)
+            if self.current_token.type in (
+                    TokenType.PLUS, TokenType.MINUS, TokenType.MULTIPLY, TokenType.DIVIDE, TokenType.MODULO):
+                self.error("Cannot use boolean in arithmetic expression")
+            return Boolean(token.value)
+        elif token.type == TokenType.LPAREN:
+            self.eat(TokenType.LPAREN)
+            node = self.expr()
+            self.eat(TokenType.RPAREN)
+            return node
+        elif token.type == TokenType.NOT:
+            self.eat(TokenType.NOT)
+            return UnaryOp(token, self.factor())
+        elif token.type == TokenType.IDENTIFIER:
+            name = token.value
+            self.eat(TokenType.IDENTIFIER)
+            if self.current_token.type == TokenType.LPAREN:
+                return self.function_call(name)
+            else:
+                return Variable(name)
+        else:
+            self.error(f"Unexpected token {token.type} in factor")
+
+    def term(self):
+        node = self.factor()
+        while self.current_token.type in (TokenType.MULTIPLY, TokenType.DIVIDE, TokenType.MODULO):
+            token = self.current_token
+            self.eat(token.type)
+            node = BinaryOp(left=node, op=token, right=self.factor())
+        return node
+
+    def arithmetic_expr(self):
+        node = self.term()
+        while self.current_token.type in (TokenType.PLUS, TokenType.MINUS):
+            token = self.current_token
+            self.eat(token.type)
+            right = self.term()
+            if isinstance(right, Boolean):
+                self.error("Cannot perform arithmetic operations with boolean values")
+            node = BinaryOp(left=node, op=token, right=right)
+        return node
+
+    def comparison_expr(self):
+        node = self.arithmetic_expr()
+        while self.current_token.type in (TokenType.EQUAL, TokenType.NOT_EQUAL,
+                                          TokenType.GREATER_THAN, TokenType.LESS_THAN,
+                                          TokenType.GREATER_THAN_OR_EQUAL, TokenType.LESS_THAN_OR_EQUAL):
+            token = self.current_token
+            self.eat(self.current_token.type)
+            node = BinaryOp(left=node, op=token, right=self.arithmetic_expr())
+        return node
+
+    def boolean_expr(self):
+        node = self.comparison_expr()
+        while self.current_token.type in (TokenType.AND, TokenType.OR):
+            token = self.current_token
+            self.eat(self.current_token.type)
+            node = BinaryOp(left=node, op=token, right=self.comparison_expr())
+        return node
+
+
+def chain(terms):
+    operators = ('+', '*', '-', '%', '/', '==', '&&', '<', '||')
+    return ' '.join(f"{i % 97 + 1} {operators[i % len(operators)]}" for i in range(terms - 1)) + ' 1'
+
+
+def nested(depth):
+    return '(' * depth + '1' + ' + 1)' * depth
+
+
+def time_parse(parser_class, lexer, tokens):
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        parser_class(TokenReplay(tokens, lexer)).parse()
+        return time.perf_counter() - start
+    except RecursionError:
+        return None
+    finally:
+        gc.enable()
+
+
+def main():
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    for name, make in (('operator chain', chain), ('nested parentheses', nested)):
+        print(f"{name}:")
+        for size in SIZES:
+            text = make(size)
+            lexer = Lexer(text)
+            tokens = list(lexer.tokenize())
+            report = []
+            for parser_class in (LegacyParser, Parser):
+                elapsed = time_parse(parser_class, lexer, tokens)
+                report.append('RecursionError' if elapsed is None else f"{size / elapsed:10.0f} terms/s")
+            print(f"  {size:>8} terms: legacy {report[0]:>16}, table-driven {report[1]:>16}")
+
+
+if __name__ == "__main__":
+    main()
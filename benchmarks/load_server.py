@@ -0,0 +1,87 @@
+"""Load generator for the evaluation server (main.py --serve).
+
+Run from the repository root:
+
+    py -m benchmarks.load_server [--jobs N] [--connections C] [--requests R]
+
+Starts a server on a temporary Unix socket with a small function library,
+sends R requests over C concurrent connections, each waiting for the
+answer to one request before sending the next, and reports throughput and
+latency as seen by the client and by the server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+LIBRARY = """
+Defun {add, (x, y)} x + y
+Defun {fib, (n)} if (n < 2) { n } else { fib(n - 1) + fib(n - 2) }
+Defun {sum_to, (n)} if (n == 0) { 0 } else { n + sum_to(n - 1) }
+"""
+EXPRESSIONS = ["add(2, 3)", "fib(12)", "sum_to(100)", "Lambd x.(x * x)(add(4, 5))"]
+
+
+async def client(socket_path, count, first_id, client_latencies, server_latencies):
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    for request_id in range(first_id, first_id + count):
+        request = {'id': request_id, 'expr': EXPRESSIONS[request_id % len(EXPRESSIONS)]}
+        start = time.perf_counter()
+        writer.write(json.dumps(request).encode() + b'\n')
+        response = json.loads(await reader.readline())
+        client_latencies.append((time.perf_counter() - start) * 1000)
+        server_latencies.append(response['latency_ms'])
+        assert response['ok'], response
+    writer.close()
+
+
+async def generate_load(socket_path, connections, requests):
+    client_latencies, server_latencies = [], []
+    share = requests // connections
+    start = time.perf_counter()
+    await asyncio.gather(*(client(socket_path, share, i * share, client_latencies, server_latencies)
+                           for i in range(connections)))
+    elapsed = time.perf_counter() - start
+    return len(client_latencies) / elapsed, client_latencies, server_latencies
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    arg_parser.add_argument('--connections', type=int, default=16)
+    arg_parser.add_argument('--requests', type=int, default=4000)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        library = os.path.join(directory, 'library.lambda')
+        with open(library, 'w') as file:
+            file.write(LIBRARY)
+        socket_path = os.path.join(directory, 'server.sock')
+        server = subprocess.Popen([sys.executable, 'main.py', '--serve', library, '--socket', socket_path,
+                                   '--jobs', str(args.jobs)], stdout=subprocess.PIPE, text=True)
+        try:
+            print(server.stdout.readline().strip())
+            throughput, client_latencies, server_latencies = asyncio.run(
+                generate_load(socket_path, args.connections, args.requests))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{len(client_latencies)} requests over {args.connections} connections: {throughput:8.0f} requests/s")
+    for name, latencies in (('client', client_latencies), ('server', server_latencies)):
+        print(f"  {name} latency ms: mean {statistics.mean(latencies):7.3f}, p50 {percentile(latencies, 0.5):7.3f}, "
+              f"p95 {percentile(latencies, 0.95):7.3f}, p99 {percentile(latencies, 0.99):7.3f}")
+
+
+if __name__ == "__main__":
+    main()
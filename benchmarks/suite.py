@@ -0,0 +1,279 @@
+"""Benchmark suite for the lexer, the parser and the interpreter, with a regression check.
+
+Run from the repository root:
+
+    py -m benchmarks.suite                      # measure and print
+    py -m benchmarks.suite --check              # also compare with benchmarks/baseline.json
+    py -m benchmarks.suite --update-baseline    # store this run as the new baseline
+
+Every workload is generated at the requested --scale and measured in
+--runs fresh child processes, so that its peak resident memory can be
+reported; each metric is the median over those processes. Lexing, parsing
+(from already lexed tokens) and evaluation are timed separately, each as
+the best of --repeat runs with the garbage collector off. A phase that
+takes less than MIN_RUN_TIME is run several times in a row per timed run,
+as timeit does, so short phases are not dominated by timer noise. Call and
+node evaluation counts come from an extra, untimed run under the
+ProfilingInterpreter.
+
+--check fails (exit status 1) when a throughput drops, or the peak memory
+grows, by more than --tolerance relative to the baseline; phases shorter
+than MIN_CHECKED_TIME are not compared. Baselines depend on the machine:
+the baseline records the machine it was measured on, and --check warns when
+it runs on a different one. Record a new baseline on the machine that runs
+the check (for example once per CI runner) before relying on it.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+from interpreter import Interpreter
+from lexer import Lexer, TokenType
+from optimizer import subtrees
+from parserR import Parser
+from profiler import ProfilingInterpreter
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# Throughput -> the time it is measured over
+THROUGHPUTS = {'tokens_per_s': 'lex_s', 'nodes_per_s': 'parse_s', 'evaluations_per_s': 'eval_s', 'calls_per_s': 'eval_s'}
+MIN_CHECKED_TIME = 0.02  # seconds; shorter phases are too noisy to compare
+MIN_RUN_TIME = 0.2  # seconds; a timed run repeats a shorter phase until it takes at least this long
+
+
+def arithmetic_chains(scale):
+    # Each chain stays well inside the recursion limit of the evaluator
+    terms = ' + '.join(f'{i} * {i % 7 + 1} - {i % 5}' for i in range(60))
+    return '\n'.join(f'({terms}) % {i + 2}' for i in range(200 * scale))
+
+
+def deep_recursion(scale):
+    # sum_to stays well inside the recursion limit of every measured interpreter; the
+    # ProfilingInterpreter that counts the calls uses the most Python frames per call
+    return '\n'.join([
+        "Defun {sum_to, (n)} if (n == 0) { 0 } else { n + sum_to(n - 1) }",
+        "Defun {count, (n, acc)} if (n == 0) { acc } else { count(n - 1, acc + 1) }",
+    ] + [f"sum_to({40 + i % 40})" for i in range(40 * scale)] + [f"count({20000 * scale}, 0)"])
+
+
+def many_defuns(scale):
+    count = 2000 * scale
+    definitions = [f"Defun {{f{i}, (x, y)}} if (x > y) {{ x - {i} }} else {{ y + {i} }}" for i in range(count)]
+    calls = [f"f{i}({i % 13}, {i % 17}) + f{count - 1 - i}(1, 2)" for i in range(count)]
+    return '\n'.join(definitions + calls)
+
+
+def nested_lambdas(scale):
+    depth = 20
+    expression = 'x0'
+    for level in range(depth, 0, -1):
+        expression = f"Lambd x{level}.(({expression}) + x{level})({level})"
+    return '\n'.join(f"Lambd x0.({expression})({i})" for i in range(300 * scale))
+
+
+def huge_file(scale):
+    lines = ["Defun {add, (x, y)} x + y", "Defun {mul, (x, y)} x * y  # product"]
+    for i in range(20000 * scale):
+        lines.append(f"add({i}, mul({i % 100}, 3)) == {i} || !(True && {i} > -{i})")
+        if i % 10 == 0:
+            lines.append(f"# generated comment {i}")
+    return '\n'.join(lines)
+
+
+WORKLOADS = {
+    'arithmetic_chains': arithmetic_chains,
+    'deep_recursion': deep_recursion,
+    'many_defuns': many_defuns,
+    'nested_lambdas': nested_lambdas,
+    'huge_file': huge_file,
+}
+
+
+class TokenReplay:
+    """Stands in for a Lexer, handing out tokens that were lexed beforehand."""
+
+    def __init__(self, tokens, lexer):
+        self.next_token = iter(tokens).__next__
+        self.line_col = lexer.line_col
+
+    def get_next_token(self):
+        return self.next_token()
+
+
+def timed(function, number):
+    # As timeit does, keep the garbage collector from adding noise to the timings
+    result = None
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(number):
+            result = None  # freed first, so the peak memory is that of a single call
+            result = function()
+        elapsed = time.perf_counter() - start
+    finally:
+        gc.enable()
+    return elapsed, result
+
+
+def best_time(function, repeat):
+    """Return the best time of one call of function over `repeat` timed runs, and its result."""
+    # Like timeit.Timer.autorange, call it more times per run until a run is long enough
+    number = 1
+    elapsed, result = timed(function, number)
+    while elapsed < MIN_RUN_TIME:
+        number *= 2
+        elapsed, result = timed(function, number)
+    best = elapsed
+    for _ in range(repeat - 1):
+        best = min(best, timed(function, number)[0])
+    return best / number, result
+
+
+def evaluate(engine, statements):
+    # visit() rather than interpret(), so that an error fails the benchmark instead of being printed
+    interpreter = engine()
+    interpreter.resolve(statements)
+    for statement in statements:
+        interpreter.visit(statement)
+    return interpreter
+
+
+def measure(name, scale, repeat):
+    text = WORKLOADS[name](scale)
+    lexer = Lexer(text)
+    lex_s, tokens = best_time(lambda: list(Lexer(text).tokenize()), repeat)
+    parse_s, statements = best_time(lambda: Parser(TokenReplay(tokens, lexer)).parse(), repeat)
+    eval_s, _ = best_time(lambda: evaluate(Interpreter, statements), repeat)
+
+    profile = evaluate(ProfilingInterpreter, statements)
+    token_count = sum(1 for token in tokens if token.type != TokenType.EOF)
+    node_count = sum(1 for statement in statements for _ in subtrees(statement))
+    evaluations = sum(profile.node_counts.values())
+    calls = sum(stats.calls for stats in profile.functions.values())
+    return {
+        'source_mb': round(len(text) / 1e6, 3),
+        'tokens': token_count,
+        'nodes': node_count,
+        'evaluations': evaluations,
+        'calls': calls,
+        'lex_s': round(lex_s, 5),
+        'parse_s': round(parse_s, 5),
+        'eval_s': round(eval_s, 5),
+        'tokens_per_s': round(token_count / lex_s),
+        'nodes_per_s': round(node_count / parse_s),
+        'evaluations_per_s': round(evaluations / eval_s),
+        'calls_per_s': round(calls / eval_s) if calls else None,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_child(name, scale, repeat):
+    completed = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.suite', '--child', name, '--scale', str(scale), '--repeat', str(repeat)],
+        capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"workload {name} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def median_results(name, scale, repeat, runs):
+    """Measure a workload in `runs` child processes and return the median of every metric."""
+    measured = [run_child(name, scale, repeat) for _ in range(runs)]
+    return {metric: None if measured[0][metric] is None else statistics.median(r[metric] for r in measured)
+            for metric in measured[0]}
+
+
+def machine():
+    """Describe the machine and the Python the benchmarks run on."""
+    processor = platform.processor()
+    try:
+        with open('/proc/cpuinfo') as file:
+            processor = next(line.split(':', 1)[1].strip() for line in file if line.startswith('model name'))
+    except (OSError, StopIteration):
+        pass
+    return {'system': f"{platform.system()} {platform.machine()}", 'processor': processor,
+            'cpus': os.cpu_count(), 'python': f"{platform.python_implementation()} {platform.python_version()}"}
+
+
+def compare(results, baseline, tolerance):
+    """Return a message for every metric that regressed by more than the tolerance."""
+    failures = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for metric, phase_time in THROUGHPUTS.items():
+            if not expected.get(metric) or result.get(metric) is None or expected[phase_time] < MIN_CHECKED_TIME:
+                continue
+            if result[metric] < expected[metric] * (1 - tolerance):
+                failures.append(f"{name}: {metric} {result[metric]} is below the baseline {expected[metric]}")
+        if result['peak_rss_mb'] > expected['peak_rss_mb'] * (1 + tolerance):
+            failures.append(f"{name}: peak_rss_mb {result['peak_rss_mb']} is above the baseline "
+                            f"{expected['peak_rss_mb']}")
+    return failures
+
+
+def print_results(results):
+    print(f"{'workload':<18} {'tokens/s':>10} {'nodes/s':>10} {'evals/s':>10} {'calls/s':>10} "
+          f"{'lex s':>8} {'parse s':>8} {'eval s':>8} {'peak MB':>8}")
+    for name, r in results.items():
+        calls = '-' if r['calls_per_s'] is None else r['calls_per_s']
+        print(f"{name:<18} {r['tokens_per_s']:>10} {r['nodes_per_s']:>10} {r['evaluations_per_s']:>10} {calls:>10} "
+              f"{r['lex_s']:>8} {r['parse_s']:>8} {r['eval_s']:>8} {r['peak_rss_mb']:>8}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--scale', type=int, default=1, help="workload size multiplier (default: %(default)s)")
+    arg_parser.add_argument('--repeat', type=int, default=3, help="timed runs per phase (default: %(default)s)")
+    arg_parser.add_argument('--runs', type=int, default=3,
+                            help="child processes per workload, whose median is reported (default: %(default)s)")
+    arg_parser.add_argument('--only', action='append', choices=WORKLOADS, help="run only this workload")
+    arg_parser.add_argument('--check', action='store_true', help="fail if slower than the baseline")
+    arg_parser.add_argument('--update-baseline', action='store_true', help="save the results as the baseline")
+    arg_parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="allowed regression as a fraction (default: %(default)s)")
+    arg_parser.add_argument('--child', choices=WORKLOADS, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.repeat < 1 or args.runs < 1:
+        arg_parser.error("--repeat and --runs must be at least 1")
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.scale, args.repeat)))
+        return 0
+
+    results = {name: median_results(name, args.scale, args.repeat, args.runs) for name in args.only or WORKLOADS}
+    print_results(results)
+
+    if args.update_baseline:
+        with open(BASELINE, 'w') as file:
+            json.dump({'scale': args.scale, 'machine': machine(), 'workloads': results}, file, indent=2)
+            file.write('\n')
+        print(f"Baseline written to {BASELINE}")
+    if args.check:
+        with open(BASELINE) as file:
+            baseline = json.load(file)
+        if baseline['scale'] != args.scale:
+            print(f"The baseline was recorded at scale {baseline['scale']}, not {args.scale}")
+            return 1
+        if baseline.get('machine') != machine():
+            print(f"Warning: the baseline was recorded on {baseline.get('machine', 'an unknown machine')}, "
+                  f"this run is on {machine()}; record a baseline here with --update-baseline")
+        failures = compare(results, baseline['workloads'], args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} of the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+import hashlib
+import os
+import pickle
+
+from lexer import Lexer
+from parserR import Parser, GRAMMAR_VERSION
+
+CACHE_DIR = '__lambdacache__'
+CACHE_SUFFIX = '.lambdac'
+
+
+def source_key(program_text):
+    """Hash identifying a source text as parsed by the current grammar."""
+    digest = hashlib.sha256(program_text.encode('utf-8'))
+    digest.update(f'grammar={GRAMMAR_VERSION}'.encode())
+    return digest.hexdigest()
+
+
+def cache_path(filename):
+    directory, base = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, CACHE_DIR, base + CACHE_SUFFIX)
+
+
+def read_cache(path, key):
+    try:
+        with open(path, 'rb') as file:
+            cached_key, program = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError, TypeError):
+        return None
+    return program if cached_key == key else None
+
+
+def write_cache(path, key, program):
+    # The cache is only an optimization: failing to write it is never an error.
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'wb') as file:
+            pickle.dump((key, program), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except (OSError, pickle.PicklingError, RecursionError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def load_program(filename, program_text):
+    """Return the parsed statements of a file, reusing its cached AST when the source is unchanged."""
+    key = source_key(program_text)
+    path = cache_path(filename)
+    program = read_cache(path, key)
+    if program is None:
+        program = Parser(Lexer(program_text)).parse()
+        write_cache(path, key, program)
+    return program
@@ -0,0 +1,188 @@
+import operator
+
+from interpreter import Environment, Interpreter
+from operators import PREFIX_OPERATORS, SHORT_CIRCUIT, STRICT_OPERATORS
+from parserR import FunctionDef, NodeVisitor, Number
+
+# Each entry turns the compiled operands into the closure for an operator whose
+# registered function is the given built-in one. An operator registered with any
+# other function, including a built-in token given a new meaning, is compiled to
+# a call of that function.
+BINARY_OPERATORS = {
+    operator.add: lambda left, right: lambda frame: left(frame) + right(frame),
+    operator.sub: lambda left, right: lambda frame: left(frame) - right(frame),
+    operator.mul: lambda left, right: lambda frame: left(frame) * right(frame),
+    operator.floordiv: lambda left, right: lambda frame: left(frame) // right(frame),
+    operator.mod: lambda left, right: lambda frame: left(frame) % right(frame),
+    operator.eq: lambda left, right: lambda frame: left(frame) == right(frame),
+    operator.ne: lambda left, right: lambda frame: left(frame) != right(frame),
+    operator.gt: lambda left, right: lambda frame: left(frame) > right(frame),
+    operator.lt: lambda left, right: lambda frame: left(frame) < right(frame),
+    operator.ge: lambda left, right: lambda frame: left(frame) >= right(frame),
+    operator.le: lambda left, right: lambda frame: left(frame) <= right(frame),
+}
+
+# Same operators with a literal right operand (as in `n - 1` or `n == 0`), saving a call per evaluation.
+CONSTANT_RIGHT_OPERATORS = {
+    operator.add: lambda left, value: lambda frame: left(frame) + value,
+    operator.sub: lambda left, value: lambda frame: left(frame) - value,
+    operator.mul: lambda left, value: lambda frame: left(frame) * value,
+    operator.eq: lambda left, value: lambda frame: left(frame) == value,
+    operator.ne: lambda left, value: lambda frame: left(frame) != value,
+    operator.gt: lambda left, value: lambda frame: left(frame) > value,
+    operator.lt: lambda left, value: lambda frame: left(frame) < value,
+    operator.ge: lambda left, value: lambda frame: left(frame) >= value,
+    operator.le: lambda left, value: lambda frame: left(frame) <= value,
+}
+
+# '&&' and '||' are defined by their short_circuit value alone, as in the tree-walking interpreter
+SHORT_CIRCUIT_OPERATORS = {
+    False: lambda left, right: lambda frame: left(frame) and right(frame),
+    True: lambda left, right: lambda frame: left(frame) or right(frame),
+}
+
+
+class ClosureCompiler(NodeVisitor):
+    """Turns a resolved AST into nested Python closures taking the current call frame.
+
+    Every node is compiled once; running the result does no visitor dispatch and
+    no operator lookup. Function bodies are compiled on their first call and kept
+    until the name is redefined.
+    """
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.bodies = {}  # FunctionDef -> compiled body
+
+    def compile(self, node):
+        return self.visit(node)
+
+    def body_of(self, func):
+        body = self.bodies.get(func)
+        if body is None:
+            body = self.bodies[func] = self.compile(func.body)
+        return body
+
+    def visit_BinaryOp(self, node):
+        op_type = node.op.type
+        left = self.compile(node.left)
+        if op_type in STRICT_OPERATORS:
+            function = STRICT_OPERATORS[op_type]
+            if isinstance(node.right, Number) and function in CONSTANT_RIGHT_OPERATORS:
+                return CONSTANT_RIGHT_OPERATORS[function](left, node.right.value)
+            right = self.compile(node.right)
+            if function in BINARY_OPERATORS:
+                return BINARY_OPERATORS[function](left, right)
+            return lambda frame: function(left(frame), right(frame))
+        if op_type in SHORT_CIRCUIT:
+            return SHORT_CIRCUIT_OPERATORS[SHORT_CIRCUIT[op_type]](left, self.compile(node.right))
+        raise Exception(f'Invalid operator {node.op}')
+
+    def visit_UnaryOp(self, node):
+        if node.op.type not in PREFIX_OPERATORS:
+            raise Exception(f'Invalid operator {node.op}')
+        expr = self.compile(node.expr)
+        function = PREFIX_OPERATORS[node.op.type].function
+        if function is operator.not_:
+            return lambda frame: not expr(frame)
+        return lambda frame: function(expr(frame))
+
+    def visit_Number(self, node):
+        value = node.value
+        return lambda frame: value
+
+    def visit_Boolean(self, node):
+        value = node.value
+        return lambda frame: value
+
+    def visit_Variable(self, node):
+        depth, slot = node.depth, node.slot
+        if depth == 0:
+            return lambda frame: frame.vars[slot]
+        if depth is not None:
+            def load(frame):
+                for _ in range(depth):
+                    frame = frame.parent
+                return frame.vars[slot]
+            return load
+
+        env = self.interpreter.env
+        name = str(node.name)
+
+        def load_global(frame):
+            if name not in env:
+                raise Exception(f"Variable '{name}' is not defined")
+            return env[name]
+        return load_global
+
+    def visit_FunctionDef(self, node):
+        interpreter = self.interpreter
+        return lambda frame: interpreter.visit_FunctionDef(node)
+
+    def visit_IfElse(self, node):
+        condition = self.compile(node.condition)
+        if_branch = self.compile(node.if_branch)
+        if node.else_branch is None:
+            return lambda frame: if_branch(frame) if condition(frame) else None
+        else_branch = self.compile(node.else_branch)
+        return lambda frame: if_branch(frame) if condition(frame) else else_branch(frame)
+
+    def visit_FunctionCall(self, node):
+        env = self.interpreter.env
+        bodies = self.bodies
+        body_of = self.body_of
+        name = node.name
+        arguments = [self.compile(arg) for arg in node.arguments]
+        argc = len(arguments)
+
+        def call(frame):
+            func = env.get(name)
+            if not func:
+                raise Exception(f"Function '{name}' is not defined")
+            if not isinstance(func, FunctionDef):
+                raise Exception(f"'{name}' is not a function")
+            if argc != len(func.arguments):
+                raise Exception(
+                    f"Function '{name}' expects {len(func.arguments)} arguments, but got {argc}")
+            body = bodies.get(func) or body_of(func)
+            return body(Environment([arg(frame) for arg in arguments]))
+        return call
+
+    def visit_LambdaExpression(self, node):
+        args = [self.compile(arg) for arg in node.args]
+        body = self.compile(node.body)
+        return lambda frame: body(Environment([arg(frame) for arg in args], frame))
+
+
+class ClosureInterpreter(Interpreter):
+    """Interpreter that runs function bodies as closures compiled on their first call.
+
+    Top-level statements run only once, so compiling them would cost more
+    than it saves; they are walked as by the tree-walking interpreter, and
+    only the calls they make go to compiled code.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.compiler = ClosureCompiler(self)
+
+    def visit_FunctionCall(self, node):
+        func = self.lookup_function(node)
+        return self.compiler.body_of(func)(Environment([self.visit(arg) for arg in node.arguments]))
+
+    def visit_LambdaExpression(self, node):
+        # Compiled code makes calls on the Python stack, so top-level lambdas need no TailCall handling either
+        frame = Environment([self.visit(arg) for arg in node.args], self.frame)
+        old_frame, self.frame = self.frame, frame
+        try:
+            return self.visit(node.body)
+        finally:
+            self.frame = old_frame
+
+    def call_function(self, func, args):
+        return self.compiler.body_of(func)(Environment(args))
+
+    def visit_FunctionDef(self, node):
+        old = self.env.get(node.name)
+        self.compiler.bodies.pop(old, None)
+        return super().visit_FunctionDef(node)
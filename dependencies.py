@@ -0,0 +1,119 @@
+from collections import defaultdict
+
+from parserR import NodeVisitor
+
+
+class CallCollector(NodeVisitor):
+    """Collects the names of the functions a tree calls, and whether it defines any."""
+
+    def __init__(self):
+        self.calls = set()
+        self.defines = False
+
+    def collect(self, node):
+        self.visit(node)
+        return self.calls
+
+    def visit_BinaryOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_UnaryOp(self, node):
+        self.visit(node.expr)
+
+    def visit_Number(self, node):
+        pass
+
+    def visit_Boolean(self, node):
+        pass
+
+    def visit_Variable(self, node):
+        pass
+
+    def visit_FunctionDef(self, node):
+        self.defines = True
+        self.visit(node.body)
+
+    def visit_FunctionCall(self, node):
+        self.calls.add(node.name)
+        for arg in node.arguments:
+            self.visit(arg)
+
+    def visit_LambdaExpression(self, node):
+        for arg in node.args:
+            self.visit(arg)
+        self.visit(node.body)
+
+    def visit_IfElse(self, node):
+        self.visit(node.condition)
+        self.visit(node.if_branch)
+        if node.else_branch is not None:
+            self.visit(node.else_branch)
+
+
+class CachedResult:
+    """The last outcome of a top-level expression; error is the message if it failed."""
+    __slots__ = ('number', 'statement', 'calls', 'value', 'error')
+
+    def __init__(self, number, statement, calls, value, error):
+        self.number = number  # position among the recorded expressions, from 1
+        self.statement = statement
+        self.calls = calls
+        self.value = value
+        self.error = error
+
+
+class DependencyGraph:
+    """Which top-level expressions use which functions, through the calls between functions.
+
+    Every function points to the functions its current definition calls, and
+    every recorded expression to the functions it calls itself. Redefining a
+    function makes stale each expression that reaches it through these calls,
+    whether directly or through other functions.
+    """
+
+    def __init__(self):
+        self.results = []  # CachedResults in the order the expressions ran
+        self.callees = {}  # function name -> names its current definition calls
+        self.callers = defaultdict(set)  # function name -> functions whose definition calls it
+        self.users = defaultdict(list)  # function name -> CachedResults of the expressions calling it
+        self.stale = set()  # CachedResults to recompute
+
+    def define(self, node, replaced):
+        """Record the calls made by a definition; if it replaces one, mark its users stale."""
+        for callee in self.callees.get(node.name, ()):
+            self.callers[callee].discard(node.name)
+        self.callees[node.name] = CallCollector().collect(node.body)
+        for callee in self.callees[node.name]:
+            self.callers[callee].add(node.name)
+        if replaced:
+            for name in self.reaching(node.name):
+                self.stale.update(self.users.get(name, ()))
+
+    def reaching(self, name):
+        """Return the name and every function whose calls lead to it."""
+        found = {name}
+        pending = [name]
+        while pending:
+            for caller in self.callers.get(pending.pop(), ()):
+                if caller not in found:
+                    found.add(caller)
+                    pending.append(caller)
+        return found
+
+    def record(self, statement, value=None, error=None):
+        """Keep the outcome of a top-level expression; expressions that define functions are not kept."""
+        collector = CallCollector()
+        calls = collector.collect(statement)
+        if collector.defines:
+            return
+        cached = CachedResult(len(self.results) + 1, statement, calls, value, error)
+        self.results.append(cached)
+        for name in calls:
+            self.users[name].append(cached)
+
+    def take_stale(self):
+        """Return the stale results in program order and forget that they are stale."""
+        stale = sorted(self.stale, key=lambda cached: cached.number)
+        self.stale.clear()
+        return stale
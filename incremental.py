@@ -0,0 +1,164 @@
+import bisect
+
+from interpreter import Interpreter
+from lexer import Lexer, TokenType
+from parserR import FunctionDef, Parser
+from resolver import Resolver, ResolverError
+
+
+class Statement:
+    """One top-level statement of an IncrementalProgram.
+
+    Its text runs from its first token up to the first token of the next
+    statement. node is None when that text could not be parsed, and error
+    then says why; error is also set for a Defun whose body does not resolve.
+    """
+    __slots__ = ('position', 'from_end', 'node', 'error')
+
+    def __init__(self, start, node, error=None):
+        self.position = start  # offset of the first token, or its distance from the end when from_end
+        self.from_end = False
+        self.node = node
+        self.error = error
+
+    def __repr__(self):
+        return f"Statement({self.node if self.error is None else self.error!r})"
+
+
+class IncrementalProgram:
+    """A program that stays parsed while its text is edited.
+
+    edit() re-lexes and re-parses from the statement before the one the edit
+    starts in, and stops as soon as a statement ends where an old statement
+    that lies entirely after the edit begins; that statement and all after it
+    are kept. Only the functions defined by the replaced and the new
+    statements are updated in the interpreter's function table, each to its
+    last definition in the program, as running the program would leave it.
+
+    Statement starts before the latest edit are kept as offsets from the start
+    of the text and those after it as distances from the end, like a gap
+    buffer, so an edit does not shift every later statement; moving to
+    another part of the text converts the statements in between.
+
+    Text that fails to parse becomes one Statement with an error, reaching up
+    to the next old statement after the edit, and the rest of the program
+    stays usable.
+    """
+
+    def __init__(self, text='', interpreter=None):
+        self.text = text
+        self.interpreter = interpreter if interpreter is not None else Interpreter()
+        self.statements = []
+        self.split = 0  # statements[split:] store their distance from the end of the text
+        self.definitions = {}  # function name -> the top-level Statements defining it
+        self.parse_from(0, 0, 0)
+
+    def start_of(self, statement):
+        return len(self.text) - statement.position if statement.from_end else statement.position
+
+    def move_split(self, index):
+        while self.split < index:
+            statement = self.statements[self.split]
+            statement.position, statement.from_end = len(self.text) - statement.position, False
+            self.split += 1
+        while self.split > index:
+            self.split -= 1
+            statement = self.statements[self.split]
+            statement.position, statement.from_end = len(self.text) - statement.position, True
+
+    def nodes(self):
+        """Return the AST of every statement, with None for text that could not be parsed."""
+        return [statement.node for statement in self.statements]
+
+    def errors(self):
+        """Return (line, column, message) for every statement with an error."""
+        lexer = Lexer(self.text)
+        return [(*lexer.line_col(self.start_of(statement)), statement.error)
+                for statement in self.statements if statement.error is not None]
+
+    def edit(self, offset, deleted, inserted):
+        """Replace `deleted` characters at `offset` with `inserted` and return the re-parsed Statements."""
+        if offset < 0 or deleted < 0 or offset + deleted > len(self.text):
+            raise ValueError(f"Edit of {deleted} characters at {offset} is outside the text")
+        edit_end = offset + deleted
+        # A statement is kept only if the character before it is unchanged too,
+        # since a leading '-' is lexed according to that character.
+        kept = bisect.bisect_right(self.statements, edit_end, key=self.start_of)
+        # The edit can join the token before it, and the statement before the
+        # edited one can take in tokens from it, so that one is re-parsed as well
+        first = max(0, bisect.bisect_right(self.statements, offset - 1, key=self.start_of) - 2)
+        start = self.start_of(self.statements[first]) if first else 0
+        self.move_split(kept)
+        self.text = self.text[:offset] + inserted + self.text[edit_end:]
+        return self.parse_from(start, first, offset + len(inserted))
+
+    def parse_from(self, start, first, changed_end):
+        """Parse statements from `start` and put them in place of statements[first:] up to where they resync.
+
+        The old statements from self.split on start after changed_end, the end
+        of the new text, and are kept once a new statement ends where one of
+        them begins.
+        """
+        parsed = []
+        end = self.split  # the old statements before this one are replaced
+        statement_start = start
+        try:
+            lexer = Lexer(self.text)
+            lexer.pos = start
+            parser = Parser(lexer)
+            while parser.current_token.type != TokenType.EOF:
+                statement_start = parser.current_token.pos
+                parsed.append(Statement(statement_start, parser.expr()))
+                if parser.current_token.type == TokenType.NEWLINE:
+                    parser.eat(TokenType.NEWLINE)
+                boundary = parser.current_token.pos
+                while end < len(self.statements) and self.start_of(self.statements[end]) < boundary:
+                    end += 1
+                if end < len(self.statements) and self.start_of(self.statements[end]) == boundary:
+                    break
+            else:
+                end = len(self.statements)
+        except Exception as e:
+            # The unchanged text from the next old statement on still parses as it did
+            resume = max(statement_start, changed_end)
+            while end < len(self.statements) and self.start_of(self.statements[end]) <= resume:
+                end += 1
+            parsed.append(Statement(statement_start, None, str(e)))
+        self.replace(first, end, parsed)
+        return parsed
+
+    def replace(self, first, end, new_statements):
+        old_statements = self.statements[first:end]
+        self.statements[first:end] = new_statements
+        self.split = first + len(new_statements)
+
+        changed = set()
+        for statement in old_statements:
+            if type(statement.node) is FunctionDef:
+                changed.add(statement.node.name)
+                self.definitions[statement.node.name].discard(statement)
+        for statement in new_statements:
+            if type(statement.node) is FunctionDef:
+                changed.add(statement.node.name)
+                self.definitions.setdefault(statement.node.name, set()).add(statement)
+        self.update_functions(changed)
+
+    def update_functions(self, names):
+        env = self.interpreter.env
+        latest = []
+        for name in names:
+            if self.definitions.get(name):
+                latest.append(max(self.definitions[name], key=self.start_of))
+            else:
+                self.definitions.pop(name, None)
+                env.pop(name, None)
+        for statement in latest:
+            self.interpreter.visit_FunctionDef(statement.node)
+        # Resolved once every new name is in the table, since bodies may name each other
+        resolver = Resolver(env)
+        for statement in latest:
+            statement.error = None
+            try:
+                resolver.resolve(statement.node)
+            except ResolverError as e:
+                statement.error = str(e)
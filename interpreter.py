@@ -1,55 +1,180 @@
-from lexer import TokenType, Lexer
-from parserR import Parser, FunctionDef
+import time
 
+from dependencies import DependencyGraph
+from lexer import Lexer
+from memo import LRUCache
+from operators import PREFIX_OPERATORS, SHORT_CIRCUIT, STRICT_OPERATORS
+from parserR import Parser, FunctionDef, NodeVisitor, BinaryOp, IfElse, FunctionCall, LambdaExpression
+from resolver import Resolver, ResolverError
+from vectorize import load_numpy, to_array, vectorized
 
-class NodeVisitor:
-    def visit(self, node):
-        return node.accept(self)
 
+class Environment:
+    """Argument values of one function or lambda call, linked to the enclosing frame.
 
-class Interpreter(NodeVisitor):
+    Values are stored by parameter position; the resolver gives every variable
+    the (depth, slot) it reads from.
+    """
+    __slots__ = ('vars', 'parent')
 
-    def __init__(self):
-        self.env = {}
+    def __init__(self, vars, parent=None):
+        self.vars = vars
+        self.parent = parent
 
 
+_MISSING = object()
 
+DEADLINE_CHECK_INTERVAL = 1024  # steps between clock reads
 
-    def visit_BinaryOp(self, node):
-        if node.op.type == TokenType.PLUS:
-            return self.visit(node.left) + self.visit(node.right)
-        elif node.op.type == TokenType.MINUS:
-            return self.visit(node.left) - self.visit(node.right)
-        elif node.op.type == TokenType.MULTIPLY:
-            return self.visit(node.left) * self.visit(node.right)
-        elif node.op.type == TokenType.DIVIDE:
-            return self.visit(node.left) // self.visit(node.right)
-        elif node.op.type == TokenType.MODULO:
-            return self.visit(node.left) % self.visit(node.right)
-        elif node.op.type == TokenType.AND:
-            return self.visit(node.left) and self.visit(node.right)
-        elif node.op.type == TokenType.OR:
-            return self.visit(node.left) or self.visit(node.right)
-        elif node.op.type == TokenType.EQUAL:
-            return self.visit(node.left) == self.visit(node.right)
-        elif node.op.type == TokenType.NOT_EQUAL:
-            return self.visit(node.left) != self.visit(node.right)
-        elif node.op.type == TokenType.GREATER_THAN:
-            return self.visit(node.left) > self.visit(node.right)
-        elif node.op.type == TokenType.LESS_THAN:
-            return self.visit(node.left) < self.visit(node.right)
-        elif node.op.type == TokenType.GREATER_THAN_OR_EQUAL:
-            return self.visit(node.left) >= self.visit(node.right)
-        elif node.op.type == TokenType.LESS_THAN_OR_EQUAL:
-            return self.visit(node.left) <= self.visit(node.right)
+
+class ResourceExhausted(Exception):
+    """Raised when an evaluation goes over one of the limits given to Interpreter.set_limits."""
+
+    def __init__(self, resource, message):
+        super().__init__(message)
+        self.resource = resource  # 'steps', 'time' or 'integer size'
+
+
+class TailCall:
+    """A call found in tail position, returned to call_in_frame instead of being made."""
+    __slots__ = ('body', 'frame', 'memo_key')
+
+    def __init__(self, body, frame, memo_key=None):
+        self.body = body
+        self.frame = frame
+        self.memo_key = memo_key  # set when the call's result should be memoized
+
+
+class Interpreter(NodeVisitor):
+
+    def __init__(self):
+        self.env = {}  # global function table
+        self.frame = None  # innermost call frame, None at top level
+        self.memo = None  # LRUCache of call results, see enable_memoization
+        self.memoized = None  # names of memoized functions, None for all of them
+        self.limited = False  # see set_limits
+        self.dependencies = None  # DependencyGraph of top-level results, see enable_recalc
+
+    def enable_memoization(self, functions=None, maxsize=1024):
+        """Cache results of calls to the named functions (all functions if None).
+
+        Functions have no side effects, so a call is keyed by the FunctionDef and
+        its argument values. Any redefinition of an existing function clears the
+        whole cache, since other functions may call the redefined one.
+        """
+        self.memo = LRUCache(maxsize)
+        self.memoized = None if functions is None else set(functions)
+
+    def enable_recalc(self):
+        """Keep the result of every top-level expression and track which functions it uses.
+
+        The functions an expression uses are those it calls, and those they
+        call in turn, read from the FunctionCall nodes of the expression and
+        of the current definitions. Redefining a function marks only the
+        expressions that use it as stale; recalculate() then runs those again,
+        like a spreadsheet recalculating the cells that refer to a changed one.
+        """
+        self.dependencies = DependencyGraph()
+
+    def recalculate(self):
+        """Run the expressions made stale by redefinitions again, in program order, and return their CachedResults."""
+        stale = self.dependencies.take_stale()
+        for cached in stale:
+            try:
+                self.reset_limits()
+                cached.value, cached.error = self.visit(cached.statement), None
+            except Exception as e:
+                cached.value, cached.error = None, str(e)
+        return stale
+
+    def set_limits(self, max_steps=None, timeout=None, max_int_bits=None):
+        """Bound every evaluation (each top-level statement) in nodes visited, seconds and integer size.
+
+        Going over a limit raises ResourceExhausted. The limits are checked by
+        a version of visit() that is only installed here, so an interpreter
+        without limits does no extra work. The clock is read every
+        DEADLINE_CHECK_INTERVAL steps, and integers are measured in bits as
+        each node returns, which also bounds the memory they take.
+        """
+        self.max_steps = float('inf') if max_steps is None else max_steps
+        self.timeout = timeout
+        self.max_int_bits = max_int_bits
+        self.limited = max_steps is not None or timeout is not None or max_int_bits is not None
+        if self.limited:
+            self.visit = self.limited_visit if max_int_bits is None else self.size_limited_visit
         else:
-            raise Exception(f'Invalid operator {node.op}')
+            self.__dict__.pop('visit', None)
+        self.reset_limits()
+
+    def reset_limits(self):
+        """Give the next evaluation a fresh step budget and deadline."""
+        if self.limited:
+            self.steps = 0  # steps taken before the current allowance
+            self.deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+            self.allowance = self.budget = min(DEADLINE_CHECK_INTERVAL, self.max_steps)
+
+    def count_step(self):
+        self.budget -= 1
+        if self.budget < 0:
+            self.check_limits()
+
+    def check_limits(self):
+        # Runs on the first step past the allowance, so only once every
+        # DEADLINE_CHECK_INTERVAL steps: the steps of the allowance are added
+        # up, the clock is read and the next allowance counts this step.
+        self.steps += self.allowance
+        if self.steps >= self.max_steps:
+            raise ResourceExhausted('steps', f"Step limit of {self.max_steps} exceeded")
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise ResourceExhausted('time', f"Time limit of {self.timeout} seconds exceeded")
+        self.allowance = min(DEADLINE_CHECK_INTERVAL, self.max_steps - self.steps)
+        self.budget = self.allowance - 1
+
+    def limited_visit(self, node):
+        # count_step() and the method table lookup of NodeVisitor.visit written
+        # out, since this runs for every node
+        budget = self.budget = self.budget - 1
+        if budget < 0:
+            self.check_limits()
+        method = self.visit_methods.get(node.__class__)
+        if method is None:
+            method = self.visit_method(node.__class__)
+        return method(self, node)
+
+    def size_limited_visit(self, node):
+        # limited_visit() with the integer size check, kept apart so the other limits do not pay for it
+        budget = self.budget = self.budget - 1
+        if budget < 0:
+            self.check_limits()
+        method = self.visit_methods.get(node.__class__)
+        if method is None:
+            method = self.visit_method(node.__class__)
+        result = method(self, node)
+        if result.__class__ is int and result.bit_length() > self.max_int_bits:
+            raise ResourceExhausted('integer size', f"Integer larger than {self.max_int_bits} bits")
+        return result
+
+    def memo_key(self, func, args):
+        if self.memo is None or (self.memoized is not None and func.name not in self.memoized):
+            return None
+        # Types are part of the key so that f(True) and f(1) are not confused
+        return func, tuple(args), tuple(map(type, args))
+
+    def visit_BinaryOp(self, node):
+        op_type = node.op.type
+        function = STRICT_OPERATORS.get(op_type)
+        if function is not None:
+            return function(self.visit(node.left), self.visit(node.right))
+        if op_type in SHORT_CIRCUIT:
+            left = self.visit(node.left)
+            return left if SHORT_CIRCUIT[op_type] == bool(left) else self.visit(node.right)
+        raise Exception(f'Invalid operator {node.op}')
 
     def visit_UnaryOp(self, node):
-        if node.op.type == TokenType.NOT:
-            return not self.visit(node.expr)
-        else:
+        op = PREFIX_OPERATORS.get(node.op.type)
+        if op is None:
             raise Exception(f'Invalid operator {node.op}')
+        return op.function(self.visit(node.expr))
 
     def visit_Number(self, node):
         return node.value
@@ -58,6 +183,15 @@ class Interpreter(NodeVisitor):
         return node.value
 
     def visit_Variable(self, node):
+        depth = node.depth
+        if depth == 0:
+            return self.frame.vars[node.slot]
+        if depth is not None:
+            frame = self.frame
+            for _ in range(depth):
+                frame = frame.parent
+            return frame.vars[node.slot]
+
         var_name = str(node.name)
         if var_name not in self.env:
             raise Exception(f"Variable '{var_name}' is not defined")
@@ -65,6 +199,10 @@ class Interpreter(NodeVisitor):
         return self.env[var_name]
 
     def visit_FunctionDef(self, node):
+        if self.memo is not None and node.name in self.env:
+            self.memo.clear()
+        if self.dependencies is not None:
+            self.dependencies.define(node, node.name in self.env)
         self.env[node.name] = node
         return None
 
@@ -77,7 +215,7 @@ class Interpreter(NodeVisitor):
         return None
 
 
-    def visit_FunctionCall(self, node):
+    def lookup_function(self, node):
         func = self.env.get(node.name)
         if not func:
             raise Exception(f"Function '{node.name}' is not defined")
@@ -88,60 +226,170 @@ class Interpreter(NodeVisitor):
         if len(node.arguments) != len(func.arguments):
             raise Exception(
                 f"Function '{node.name}' expects {len(func.arguments)} arguments, but got {len(node.arguments)}")
+        return func
 
-        # Create a new environment for the function call
-        local_env = self.env.copy()
-        for param, arg in zip(func.arguments, node.arguments):
-            local_env[param] = self.visit(arg)
-
-        # Save the current environment and set the new one
-        old_env = self.env
-        self.env = local_env
-
-        try:
-            # Execute the function body
-            result = self.visit(func.body)
-        finally:
-            # Restore the old environment
-            self.env = old_env
-
-        return result
+    def visit_FunctionCall(self, node):
+        func = self.lookup_function(node)
+        args = [self.visit(arg) for arg in node.arguments]
+        key = self.memo_key(func, args)
+        if key is not None:
+            result = self.memo.get(key, _MISSING)
+            if result is not _MISSING:
+                return result
+        # A function body only sees its own parameters and the global function
+        # table, so the new frame does not link to the caller's frame.
+        return self.call_in_frame(func.body, Environment(args), key)
 
     def visit_LambdaExpression(self, node):
-        # Create a new environment for the lambda execution
-        local_env = self.env.copy()
-
-        # Bind arguments to parameters
-        for param, arg in zip(node.params, node.args):
-            local_env[param] = self.visit(arg)
-
-        # Save the current environment and set the new one
-        old_env = self.env
-        self.env = local_env
-
+        # Lambdas are applied where they are written, so they can see the enclosing frame
+        frame = Environment([self.visit(arg) for arg in node.args], self.frame)
+        return self.call_in_frame(node.body, frame)
+
+    def call_in_frame(self, body, frame, memo_key=None):
+        # Calls in tail position come back as TailCall and are run by this loop,
+        # so tail recursion does not grow the Python stack. Every memoized call
+        # in the chain gets the final result.
+        old_frame = self.frame
+        memo_keys = [memo_key] if memo_key is not None else None
         try:
-            # Execute the lambda body
-            result = self.visit(node.body)
+            while True:
+                if self.limited:
+                    self.count_step()  # a tail call of a function without arguments visits nothing
+                self.frame = frame
+                result = self.visit_tail(body)
+                if type(result) is not TailCall:
+                    if memo_keys:
+                        for key in memo_keys:
+                            self.memo.put(key, result)
+                    return result
+                body, frame = result.body, result.frame
+                if result.memo_key is not None:
+                    if memo_keys is None:
+                        memo_keys = []
+                    memo_keys.append(result.memo_key)
         finally:
-            # Restore the old environment
-            self.env = old_env
-
-        return result
+            # Restore the old frame
+            self.frame = old_frame
+
+    def visit_tail(self, node):
+        """Evaluate a function or lambda body, returning a TailCall for a call in tail position.
+
+        Tail positions are the branches of an if/else, the right operand of
+        '||' and '&&', and the bodies of lambdas applied in tail position.
+        """
+        while True:
+            node_type = type(node)
+            if node_type is IfElse:
+                if self.visit(node.condition):
+                    node = node.if_branch
+                elif node.else_branch is not None:
+                    node = node.else_branch
+                else:
+                    return None
+            elif node_type is BinaryOp and node.op.type in SHORT_CIRCUIT:
+                left = self.visit(node.left)
+                if SHORT_CIRCUIT[node.op.type] == bool(left):
+                    return left
+                node = node.right
+            elif node_type is FunctionCall:
+                func = self.lookup_function(node)
+                args = [self.visit(arg) for arg in node.arguments]
+                key = self.memo_key(func, args)
+                if key is not None:
+                    result = self.memo.get(key, _MISSING)
+                    if result is not _MISSING:
+                        return result
+                return TailCall(func.body, Environment(args), key)
+            elif node_type is LambdaExpression:
+                self.frame = Environment([self.visit(arg) for arg in node.args], self.frame)
+                node = node.body
+            else:
+                return self.visit(node)
+
+    def map_function(self, name, columns):
+        """Call the named function once per row of `columns`, which hold one argument each.
+
+        Columns may be NumPy arrays, array.array or any other sequences of the
+        same length. With NumPy installed the results come back as a NumPy
+        array, and a body made only of arithmetic, comparisons, '!', '&&',
+        '||' and if/else over integer columns is evaluated as whole-array
+        operations when that gives exactly the interpreter's results (see
+        vectorize.VectorCompiler). Any other function is called row by row,
+        as is every function without NumPy, and then a list is returned. Row by
+        row calls go through call_function, so each engine runs them its own way.
+        """
+        func = self.lookup_function(FunctionCall(name, columns))
+        if not columns:
+            raise Exception(f"Function '{name}' has no parameters to map over")
+        length = len(columns[0])
+        if any(len(column) != length for column in columns):
+            raise Exception("All columns must have the same length")
+        Resolver(self.env).resolve(func)
+
+        np = load_numpy()
+        # The vectorized operations do not count steps, so limits need the row by row calls
+        if np is not None and not self.limited:
+            result = vectorized(np, func, columns, length)
+            if result is not None:
+                return result
+        results = []
+        for args in zip(*(column.tolist() if hasattr(column, 'tolist') else column for column in columns)):
+            self.reset_limits()
+            results.append(self.call_function(func, list(args)))
+        return results if np is None else to_array(np, results)
+
+    def call_function(self, func, args):
+        """Call a function from the table with a list of argument values, the way this engine runs calls."""
+        key = self.memo_key(func, args)
+        if key is not None:
+            result = self.memo.get(key, _MISSING)
+            if result is not _MISSING:
+                return result
+        return self.call_in_frame(func.body, Environment(args), key)
+
+    def resolve(self, tree, late_binding=False):
+        """Bind every variable in the tree to its frame slot; raises ResolverError for unbound names.
+
+        With late_binding, names in function bodies that are not defined yet
+        are looked up when the body runs (see Resolver).
+        """
+        Resolver(self.env, late_binding).resolve(tree)
+
+    def record(self, statement, value=None, error=None):
+        if self.dependencies is not None:
+            self.dependencies.record(statement, value, error)
 
     def interpret(self, tree):
+        # Run statement by statement, so a function body may name a function defined further on
         results = []
         if isinstance(tree, list):
+            try:
+                self.resolve(tree, late_binding=True)
+            except ResolverError as e:
+                print(f"Resolver error : {str(e)}")
+                return None
             for node in tree:
                 try:
+                    self.reset_limits()
                     result = self.visit(node)
+                    self.record(node, result)
                     if result is not None:
                         results.append(result)
                 except Exception as e:
+                    self.record(node, error=str(e))
                     print(f"Runtime error : {str(e)}")
         else:
             try:
+                self.resolve(tree, late_binding=True)
+            except Exception as e:
+                print(f"{str(e)}")
+                return None
+            try:
+                self.reset_limits()
                 results.append(self.visit(tree))
+                self.record(tree, results[-1])
             except Exception as e:
+                self.record(tree, error=str(e))
                 print(f"{str(e)}")
         return results[0] if results else None
 
@@ -184,5 +432,13 @@ def test_interpreter2():
     print(result)
 
 
+def test_interpreter3():
+    # Statements run one at a time, as in a program, the REPL or a stream: f names g before g is defined
+    code = "Defun {f, (x)} if (x == 0) {g} else {x}\nDefun {g, ()} 1\nf(3)"
+    interpreter = Interpreter()
+    results = [interpreter.interpret(statement) for statement in Parser(Lexer(code)).parse()]
+    print(f"Result: {results[-1]}" if results[-1] == 3 else f"Mismatch: {results[-1]}, expected 3")
+
+
 if __name__ == "__main__":
     test_interpreter()
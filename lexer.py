@@ -37,9 +37,12 @@ class TokenType(Enum):
 
 
 class Token:
-    def __init__(self, type: TokenType, value):
+    __slots__ = ('type', 'value', 'pos')
+
+    def __init__(self, type: TokenType, value, pos=None):
         self.type = type
         self.value = value
+        self.pos = pos  # offset of the first character in the source text
 
     def __str__(self):
         return f'Token({self.type.name}, {self.value})'
@@ -49,13 +52,57 @@ class LexerError(Exception):
     pass
 
 
+# Any run of whitespace and '#' comments (a comment ends after its newline).
+SKIP_PATTERN = re.compile(r'(?:\s+|#[^\n]*\n?)+')
+
+# The alternatives are tried in order, so keywords are matched before identifiers
+# and two-character operators before their one-character prefixes. A leading '-'
+# is only part of an integer at the start of the input or right after one of
+# '+-*/( ', otherwise it is scanned as MINUS.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<INTEGER>(?:(?<=[-+*/( ])|^)-\d+|\d+)
+  | (?P<IF>if)
+  | (?P<ELSE>else)
+  | (?P<BOOLEAN>True|False)
+  | (?P<DEFUN>Defun)
+  | (?P<LAMBD>Lambd)
+  | (?P<DOT>\.)
+  | (?P<IDENTIFIER>[a-zA-Z][a-zA-Z0-9_]*)
+  | (?P<PLUS>\+)
+  | (?P<MINUS>-)
+  | (?P<MULTIPLY>\*)
+  | (?P<DIVIDE>/)
+  | (?P<MODULO>%)
+  | (?P<LPAREN>\()
+  | (?P<RPAREN>\))
+  | (?P<AND>&&)
+  | (?P<OR>\|\|)
+  | (?P<NOT_EQUAL>!=)
+  | (?P<NOT>!)
+  | (?P<EQUAL>==)
+  | (?P<GREATER_THAN_OR_EQUAL>>=)
+  | (?P<GREATER_THAN>>)
+  | (?P<LESS_THAN_OR_EQUAL><=)
+  | (?P<LESS_THAN><)
+  | (?P<COMMA>,)
+  | (?P<LBRACE>\{)
+  | (?P<RBRACE>\})
+""", re.VERBOSE)
+
+
 class Lexer:
     def __init__(self, text):
         self.text = text
         self.pos = 0
 
     def error(self):
-        raise Exception(f"Lexer error: invalid character '{self.text[self.pos]}'")
+        line, column = self.line_col(self.pos)
+        raise Exception(f"Lexer error: invalid character '{self.text[self.pos]}' at line {line}, column {column}")
+
+    def line_col(self, pos):
+        """Translate a text offset into a 1-based (line, column) pair."""
+        line_start = self.text.rfind('\n', 0, pos) + 1
+        return self.text.count('\n', 0, pos) + 1, pos - line_start + 1
 
     def peek(self):
         peek_pos = self.pos + 1
@@ -65,144 +112,137 @@ class Lexer:
 
     def get_next_token(self):
         if self.pos >= len(self.text):
-            return Token(TokenType.EOF, None)
-
-        current_char = self.text[self.pos]
-
-        # skip whitespace
-        if current_char.isspace():
-            self.pos += 1
-            return self.get_next_token()
-
-        if current_char == '#':
-            while current_char != '\n' and self.pos < len(self.text):
-                self.pos += 1
-                current_char = self.text[self.pos]
-            self.pos += 1  # Skip the newline character
-            return self.get_next_token()
-
-        # Integer
-        if current_char.isdigit() or (current_char == '-' and (self.pos == 0 or self.text[self.pos - 1] in '+-*/( ')):
-            integer_pattern = r'-?\d+'
-            match = re.match(integer_pattern, self.text[self.pos:])
-            if match:
-                value = int(match.group())
-                self.pos += len(match.group())
-                return Token(TokenType.INTEGER, value)
-
-        if self.text[self.pos:].startswith("if"):
-            self.pos += len("if")
-            return Token(TokenType.IF, "if")
-
-        if self.text[self.pos:].startswith("else"):
-            self.pos += len("else")
-            return Token(TokenType.ELSE, "else")
-
-        # Boolean
-        boolean_pattern = r'True|False'
-        match = re.match(boolean_pattern, self.text[self.pos:])
-        if match:
-            value = match.group() == 'True'
-            self.pos += len(match.group())
-            return Token(TokenType.BOOLEAN, value)
-
-        # Func
-        if self.text[self.pos:].startswith("Defun"):
-            self.pos += len("Defun")
-            return Token(TokenType.DEFUN, "Defun")
-
-        if self.text[self.pos:].startswith("Lambd"):
-            self.pos += len("Lambd")
-            return Token(TokenType.LAMBD, "Lambd")
-
-        if current_char == '.':
-            self.pos += 1
-            return Token(TokenType.DOT, '.')
-        # Identifiers (e.g., function names)
-        if current_char.isalpha():
-            identifier_pattern = r'[a-zA-Z_][a-zA-Z0-9_]*'
-            match = re.match(identifier_pattern, self.text[self.pos:])
-            if match:
-                value = match.group()
-                self.pos += len(match.group())
-                return Token(TokenType.IDENTIFIER, value)
-
-        # Arithmetic operations
-        if current_char == '+':
-            self.pos += 1
-            return Token(TokenType.PLUS, '+')
-        elif current_char == '-':
-            self.pos += 1
-            return Token(TokenType.MINUS, '-')
-        elif current_char == '*':
-            self.pos += 1
-            return Token(TokenType.MULTIPLY, '*')
-        elif current_char == '/':
-            self.pos += 1
-            return Token(TokenType.DIVIDE, '/')
-        elif current_char == '%':
-            self.pos += 1
-            return Token(TokenType.MODULO, '%')
-        elif current_char == '(':
-            self.pos += 1
-            return Token(TokenType.LPAREN, '(')
-        elif current_char == ')':
-            self.pos += 1
-            return Token(TokenType.RPAREN, ')')
-
-        # Boolean operations
-        if current_char == '&' and self.peek() == '&':
-            self.pos += 2
-            return Token(TokenType.AND, '&&')
-        elif current_char == '|' and self.peek() == '|':
-            self.pos += 2
-            return Token(TokenType.OR, '||')
-        elif current_char == '!':
-            if self.peek() == '=':
-                self.pos += 2
-                return Token(TokenType.NOT_EQUAL, '!=')
-            self.pos += 1
-            return Token(TokenType.NOT, '!')
-
-        # Comparison operations
-        if current_char == '=':
-            if self.peek() == '=':
-                self.pos += 2
-                return Token(TokenType.EQUAL, '==')
-        elif current_char == '>':
-            if self.peek() == '=':
-                self.pos += 2
-                return Token(TokenType.GREATER_THAN_OR_EQUAL, '>=')
-            self.pos += 1
-            return Token(TokenType.GREATER_THAN, '>')
-        elif current_char == '<':
-            if self.peek() == '=':
-                self.pos += 2
-                return Token(TokenType.LESS_THAN_OR_EQUAL, '<=')
-            self.pos += 1
-            return Token(TokenType.LESS_THAN, '<')
-
-            # comma
-        if current_char == ',':
-            self.pos += 1
-            return Token(TokenType.COMMA, ',')
-
-            # Braces
-        if current_char == '{':
-            self.pos += 1
-            return Token(TokenType.LBRACE, '{')
-
-        if current_char == '}':
-            self.pos += 1
-            return Token(TokenType.RBRACE, '}')
-
-        if current_char == '\n':
-            self.pos += 1
-            return Token(TokenType.NEWLINE, '\n')
-        # If we've reached this point, the character is invalid
-        self.error()
-        self.pos += 1
-        return Token(TokenType.INVALID, current_char)
+            return Token(TokenType.EOF, None, self.pos)
+
+        # skip whitespace and comments in one jump
+        skipped = SKIP_PATTERN.match(self.text, self.pos)
+        if skipped:
+            self.pos = skipped.end()
+            if self.pos >= len(self.text):
+                return Token(TokenType.EOF, None, self.pos)
+
+        match = TOKEN_PATTERN.match(self.text, self.pos)
+        if match is None:
+            self.error()
+
+        kind = match.lastgroup
+        lexeme = match.group(kind)
+        start = self.pos
+        self.pos = match.end()
+        if kind == 'INTEGER':
+            return Token(TokenType.INTEGER, int(lexeme), start)
+        if kind == 'BOOLEAN':
+            return Token(TokenType.BOOLEAN, lexeme == 'True', start)
+        return Token(TokenType[kind], lexeme, start)
+
+    def tokenize(self):
+        """Yield every token of the input in a single pass, ending with EOF."""
+        token = self.get_next_token()
+        while token.type != TokenType.EOF:
+            yield token
+            token = self.get_next_token()
+        yield token
+
+
+class StreamLexer(Lexer):
+    """Lexer that reads its input from a text stream a chunk at a time.
+
+    Text before the current position is dropped as soon as more is read, so
+    memory does not grow with the length of the input. Token positions are
+    offsets in the whole stream, as with Lexer.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        super().__init__('')
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.at_end = False
+        self.base = 0  # stream offset of self.text[0]
+        self.base_line = 1  # line number at self.base
+        self.base_line_start = 0  # stream offset of the start of that line
+        self.token_start = 0  # offset in self.text of the last token returned
+        self.dropped_token = None  # (offset, line, column) of the last token once its text is dropped
+
+    def refill(self):
+        """Read another chunk into the buffer. Returns False at the end of the input."""
+        if self.at_end:
+            return False
+        # One character before the current position is kept for the
+        # look-behind of negative integers.
+        drop = max(0, self.pos - 1)
+        if drop:
+            if self.token_start < drop:
+                # The parser reports syntax errors at the last token it was given
+                token_pos = self.base + self.token_start
+                self.dropped_token = (token_pos, *self.line_col(token_pos))
+            dropped = self.text[:drop]
+            newlines = dropped.count('\n')
+            if newlines:
+                self.base_line += newlines
+                self.base_line_start = self.base + dropped.rfind('\n') + 1
+            self.base += drop
+            self.text = self.text[drop:]
+            self.pos -= drop
+            self.token_start -= drop
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.at_end = True
+            return False
+        self.text += chunk
+        return True
+
+    def error(self):
+        line, column = self.line_col(self.base + self.pos)
+        raise Exception(f"Lexer error: invalid character '{self.text[self.pos]}' at line {line}, column {column}")
+
+    def line_col(self, pos):
+        if self.dropped_token is not None and pos == self.dropped_token[0]:
+            return self.dropped_token[1:]
+        offset = max(0, pos - self.base)
+        line_start = self.text.rfind('\n', 0, offset)
+        line_start = self.base_line_start if line_start < 0 else self.base + line_start + 1
+        return self.base_line + self.text.count('\n', 0, offset), pos - line_start + 1
+
+    def get_next_token(self):
+        # A match that reaches the end of the buffer may go on in the next
+        # chunk (as in '=' followed by '='), so more is read and it is retried.
+        while True:
+            skipped = SKIP_PATTERN.match(self.text, self.pos)
+            if skipped:
+                end = skipped.end()
+                if end == len(self.text) and not self.at_end:
+                    # Only a comment on the last line can continue
+                    last_newline = self.text.rfind('\n', self.pos, end)
+                    comment = self.text.find('#', self.pos if last_newline < 0 else last_newline + 1, end)
+                    self.pos = end if comment < 0 else comment
+                    self.refill()
+                    continue
+                self.pos = end
+            if self.pos >= len(self.text):
+                if self.refill():
+                    continue
+                return Token(TokenType.EOF, None, self.base + self.pos)
+
+            match = TOKEN_PATTERN.match(self.text, self.pos)
+            if (match is None or match.end() == len(self.text)) and not self.at_end:
+                self.refill()
+                continue
+            if match is None:
+                self.error()
+            break
+
+        kind = match.lastgroup
+        lexeme = match.group(kind)
+        self.token_start = self.pos
+        start = self.base + self.pos
+        self.pos = match.end()
+        if kind == 'INTEGER':
+            return Token(TokenType.INTEGER, int(lexeme), start)
+        if kind == 'BOOLEAN':
+            return Token(TokenType.BOOLEAN, lexeme == 'True', start)
+        return Token(TokenType[kind], lexeme, start)
 
 
 # Test the lexer
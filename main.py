@@ -1,28 +1,153 @@
+import argparse
 import sys
+from collections import Counter
+from functools import partial
 
+from compile_cache import load_program
+from compiler import ClosureInterpreter
 from interpreter import Interpreter
-from lexer import Lexer
+from lexer import Lexer, StreamLexer
+from optimizer import Optimizer
 from parserR import Parser, ParserError
+from profiler import ProfilingInterpreter
+from stack_eval import StackInterpreter
+from transpiler import TranspilingInterpreter
 
+DEFAULT_PORT = 7878  # of --serve; defined here so that parsing the arguments does not load the server
 
-def main():
-    debug_mode = False
-    interpreter = Interpreter()
+ENGINES = {
+    'tree': Interpreter,
+    'closure': ClosureInterpreter,
+    'python': TranspilingInterpreter,
+    'stack': StackInterpreter,
+}
 
-    if len(sys.argv) in [2, 3]:  # Executing from file
-        filename = sys.argv[1]
-        if len(sys.argv) == 3 and sys.argv[2] == '-d':
-            debug_mode = True
 
-        if filename.endswith(".lambda"):
-            run_file(filename, debug_mode)
-        else:
+def parse_args(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Run a .lambda program, or start the REPL when no file is given.")
+    arg_parser.add_argument('filename', nargs='?',
+                            help="program to run (must end with .lambda), or - for stdin; with --serve, the "
+                                 "library whose functions requests can call")
+    arg_parser.add_argument('-d', '--debug', action='store_true', help="print the AST and environment after each statement")
+    arg_parser.add_argument('--engine', choices=ENGINES, default='tree',
+                            help="execution engine: the tree-walking visitor, the closure compiler, "
+                                 "the Python source transpiler or the explicit-stack evaluator")
+    arg_parser.add_argument('--memoize', action='store_true', help="cache the results of every function (tree engine)")
+    arg_parser.add_argument('--memoize-fn', action='append', metavar='NAME',
+                            help="cache the results of this function only; may be repeated (tree engine)")
+    arg_parser.add_argument('--memo-size', type=int, default=1024, metavar='N',
+                            help="maximum number of cached results (default: %(default)s)")
+    arg_parser.add_argument('--max-steps', type=int, metavar='N',
+                            help="stop a statement after it has evaluated N nodes (tree engine)")
+    arg_parser.add_argument('--timeout', type=float, metavar='SECONDS',
+                            help="stop a statement after it has run this long (tree engine)")
+    arg_parser.add_argument('--max-int-bits', type=int, metavar='N',
+                            help="stop a statement that produces an integer larger than N bits (tree engine)")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="report calls and time per function and evaluations per node type (tree engine)")
+    arg_parser.add_argument('--profile-out', metavar='FILE',
+                            help="with --profile, also write collapsed stacks for flame graph tools to FILE")
+    arg_parser.add_argument('--recalc', action='store_true',
+                            help="when a function is redefined, run the earlier expressions that use it again "
+                                 "and print their new results")
+    arg_parser.add_argument('-O', '--optimize', action='store_true',
+                            help="fold constant expressions and simplify the program before running it")
+    arg_parser.add_argument('--dump-ast', action='store_true', help="with -O, print the AST before and after optimization")
+    arg_parser.add_argument('--stream', action='store_true',
+                            help="run each statement as soon as it is read instead of parsing the whole file first "
+                                 "(always on when reading from stdin)")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                            help="evaluate independent expressions in N worker processes (default: %(default)s)")
+    arg_parser.add_argument('--serve', action='store_true',
+                            help="run an evaluation server taking line-delimited JSON requests")
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                            help="with --serve, TCP port to listen on at 127.0.0.1 (default: %(default)s)")
+    arg_parser.add_argument('--socket', metavar='PATH', help="with --serve, listen on this Unix socket instead of TCP")
+    args = arg_parser.parse_args(argv)
+    if args.dump_ast and not args.optimize:
+        arg_parser.error("--dump-ast requires -O")
+    if (args.memoize or args.memoize_fn) and args.engine != 'tree':
+        arg_parser.error("memoization is only supported by the tree engine")
+    if (args.max_steps, args.timeout, args.max_int_bits) != (None, None, None) and args.engine != 'tree':
+        arg_parser.error("resource limits are only supported by the tree engine")
+    for name in ('max_steps', 'timeout', 'max_int_bits'):
+        if getattr(args, name) is not None and getattr(args, name) <= 0:
+            arg_parser.error(f"--{name.replace('_', '-')} must be positive")
+    if args.profile_out and not args.profile:
+        arg_parser.error("--profile-out requires --profile")
+    if args.profile and args.engine != 'tree':
+        arg_parser.error("profiling is only supported by the tree engine")
+    if args.profile and (args.max_steps, args.timeout, args.max_int_bits) != (None, None, None):
+        arg_parser.error("--profile cannot be combined with resource limits")
+    if args.profile and (args.jobs > 1 or args.serve):
+        arg_parser.error("--profile runs the program in a single process and cannot be used with --jobs or --serve")
+    if args.memo_size < 1:
+        arg_parser.error("--memo-size must be at least 1")
+    if args.jobs < 1:
+        arg_parser.error("--jobs must be at least 1")
+    if args.jobs > 1 and (args.stream or args.filename == '-'):
+        arg_parser.error("--jobs needs the whole program and cannot be used when streaming")
+    if args.recalc and (args.jobs > 1 or args.serve):
+        arg_parser.error("--recalc keeps results in a single interpreter and cannot be used with --jobs or --serve")
+    if args.serve and (args.stream or args.filename == '-'):
+        arg_parser.error("--serve loads its library from a file and cannot be used when streaming")
+    return args
+
+
+def create_interpreter(args):
+    interpreter = ProfilingInterpreter(args.profile_out) if args.profile else ENGINES[args.engine]()
+    if args.memoize or args.memoize_fn:
+        interpreter.enable_memoization(None if args.memoize else args.memoize_fn, args.memo_size)
+    if (args.max_steps, args.timeout, args.max_int_bits) != (None, None, None):
+        interpreter.set_limits(args.max_steps, args.timeout, args.max_int_bits)
+    if args.recalc:
+        interpreter.enable_recalc()
+    return interpreter
+
+
+def interpreter_factory(args):
+    # A partial rather than a closure so that worker processes can be sent it
+    return partial(create_interpreter, args)
+
+
+def optimize_statements(statements, dump_ast=False, inline_functions=False):
+    optimized = Optimizer(inline_functions).optimize(statements)
+    if dump_ast:
+        print("AST before optimization:\n", statements)
+        print("AST after optimization:\n", optimized)
+    return optimized
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    engine = interpreter_factory(args)
+    optimize = partial(optimize_statements, dump_ast=args.dump_ast) if args.optimize else None
+
+    if args.serve:  # Evaluation server
+        # Imported only here, since asyncio and multiprocessing would slow down the start of every other run
+        from server import run_server
+
+        if optimize is not None:
+            optimize = partial(optimize, inline_functions=True)
+        run_server(args.filename, args.port, engine, args.jobs, args.socket, optimize)
+    elif args.filename == '-':  # Executing from stdin
+        run_stream(sys.stdin, args.debug, engine, optimize)
+    elif args.filename is not None:  # Executing from file
+        if not args.filename.endswith(".lambda"):
             print("File must have a .lambda extension")
+        elif args.stream:
+            run_file_stream(args.filename, args.debug, engine, optimize)
+        else:
+            # The whole program is known up front, so calls to small functions can be
+            # inlined, except where recalculation needs to see every call
+            if optimize is not None and not args.recalc:
+                optimize = partial(optimize, inline_functions=True)
+            run_file(args.filename, args.debug, engine, optimize, args.jobs)
     else:
-        run_interactive_mode(interpreter, debug_mode)
+        run_interactive_mode(engine(), args.debug, optimize)
 
 
-def run_interactive_mode(interpreter, debug_mode):  # REPL mode
+def run_interactive_mode(interpreter, debug_mode, optimize=None):  # REPL mode
     while True:
         try:
             prompt = 'debug>> ' if debug_mode else 'foo>> '
@@ -39,55 +164,144 @@ def run_interactive_mode(interpreter, debug_mode):  # REPL mode
         if not text:
             continue
 
-        execute_single_statement(text, interpreter, debug_mode)
+        execute_single_statement(text, interpreter, debug_mode, optimize)
+    if isinstance(interpreter, ProfilingInterpreter):
+        print(interpreter.report())
 
 
-def execute_single_statement(text, interpreter, debug_mode):
+def execute_single_statement(text, interpreter, debug_mode, optimize=None):
     try:
         lexer = Lexer(text)
         parser = Parser(lexer)
         tree = parser.parse()
+        if optimize is not None:
+            tree = optimize(tree)
         if debug_mode:
             print(tree)
         result = interpreter.interpret(tree)
         if result is not None:
             print(result)
+        report_recalculated(interpreter)
         if debug_mode:
             print("Interpreter current env:\n", list(interpreter.env.keys()))
+            if interpreter.memo is not None:
+                print(interpreter.memo)
     except ParserError as e:
         print(f"Parser Error: {e}")
     except Exception as e:
         print(f"Error: {e}")
 
 
-def run_program(program_text, debug_mode):
-    interpreter = Interpreter()
-    lexer = Lexer(program_text)
-    parser = Parser(lexer)
+def run_program(program_text, debug_mode, filename=None, engine=Interpreter, optimize=None, jobs=1):
+    interpreter = engine()
     try:
-        ast = parser.parse()
+        if filename is None:
+            ast = Parser(Lexer(program_text)).parse()
+        else:
+            ast = load_program(filename, program_text)
+        if optimize is not None:
+            ast = optimize(ast)
+        # Report unbound names before any statement runs; this also resolves the
+        # variables that inlining put into function bodies
+        interpreter.resolve(ast)
+        if jobs > 1:
+            run_statements_parallel(interpreter, ast, debug_mode, jobs, engine)
+        else:
+            run_statements(interpreter, ast, debug_mode)
+    except Exception as e:
+        print(f"Error executing program: {e}")
 
-        for statement in ast:
 
-            result = interpreter.interpret(statement)
-            if debug_mode:
-                print("AST of the statement:\n", statement, end="\n")
-                print("Interpreter current env:\n", list(interpreter.env.keys()))
-
-                if result is not None:
-                    print("Result: ", result, end="\n\n")
-            else:
-                if result is not None:
-                    print(result)
+def run_stream(stream, debug_mode, engine=Interpreter, optimize=None):
+    """Run a program statement by statement while it is being read.
+
+    Only the statement being run is held in memory, so inputs of any size can
+    be piped through. Names are checked when their statement runs rather than
+    up front, and the parse cache and function inlining are not used.
+    """
+    interpreter = engine()
+    try:
+        statements = Parser(StreamLexer(stream)).iter_statements()
+        if optimize is not None:
+            statements = (optimize([statement])[0] for statement in statements)
+        run_statements(interpreter, statements, debug_mode)
     except Exception as e:
         print(f"Error executing program: {e}")
 
 
-def run_file(filename, debug_mode):
+def run_statements(interpreter, statements, debug_mode):
+    for statement in statements:
+        report_result(interpreter, statement, interpreter.interpret(statement), debug_mode)
+        report_recalculated(interpreter)
+    if debug_mode and interpreter.memo is not None:
+        print(interpreter.memo)
+    if isinstance(interpreter, ProfilingInterpreter):
+        print(interpreter.report())
+
+
+def run_statements_parallel(interpreter, statements, debug_mode, jobs, engine):
+    """Like run_statements, with the expressions evaluated in `jobs` worker processes.
+
+    Definitions still run here as well, so the environment printed in debug
+    mode is the same as in a sequential run. The memo cache statistics are
+    the hits and misses of all the workers, whose caches are separate. A
+    program with a Defun inside an expression is run by run_statements instead.
+    """
+    # Imported only here, since loading multiprocessing would slow down the start of every other run
+    from parallel import can_run_in_parallel, evaluate_parallel
+
+    if not can_run_in_parallel(statements):
+        run_statements(interpreter, statements, debug_mode)
+        return
+    memo_counts = Counter()
+    for statement, outcome in zip(statements, evaluate_parallel(statements, jobs, engine, memo_counts)):
+        if outcome is None:
+            result = interpreter.interpret(statement)
+        else:
+            status, result = outcome
+            if status == 'err':
+                print(result)
+                result = None
+        report_result(interpreter, statement, result, debug_mode)
+    if debug_mode and interpreter.memo is not None:
+        print(f"Memo cache: {memo_counts['hits']} hits, {memo_counts['misses']} misses in {jobs} worker processes")
+
+
+def report_result(interpreter, statement, result, debug_mode):
+    if debug_mode:
+        print("AST of the statement:\n", statement, end="\n")
+        print("Interpreter current env:\n", list(interpreter.env.keys()))
+
+        if result is not None:
+            print("Result: ", result, end="\n\n")
+    else:
+        if result is not None:
+            print(result)
+
+
+def report_recalculated(interpreter):
+    if interpreter.dependencies is None:
+        return
+    for cached in interpreter.recalculate():
+        outcome = cached.value if cached.error is None else f"Runtime error : {cached.error}"
+        print(f"Recalculated #{cached.number} {cached.statement}: {outcome}")
+
+
+def run_file(filename, debug_mode, engine=Interpreter, optimize=None, jobs=1):
     try:
         with open(filename, 'r') as file:
             program_text = file.read()
-        run_program(program_text, debug_mode)
+        run_program(program_text, debug_mode, filename, engine, optimize, jobs)
+    except FileNotFoundError:
+        print(f"File not found: {filename}")
+    except Exception as e:
+        print(f"Error reading or executing file: {e}")
+
+
+def run_file_stream(filename, debug_mode, engine=Interpreter, optimize=None):
+    try:
+        with open(filename, 'r') as file:
+            run_stream(file, debug_mode, engine, optimize)
     except FileNotFoundError:
         print(f"File not found: {filename}")
     except Exception as e:
@@ -0,0 +1,85 @@
+import operator
+
+from lexer import TokenType
+
+# Binding strength of the operators, from loosest to tightest
+BOOLEAN_LEVEL = 1
+COMPARISON_LEVEL = 2
+ADDITIVE_LEVEL = 3
+MULTIPLICATIVE_LEVEL = 4
+PREFIX_LEVEL = 5
+
+
+class Operator:
+    """What the parser and the backends know about one operator.
+
+    function computes the result from the operand values. For '&&' and '||'
+    short_circuit is the truth value of the left operand that makes it the
+    result without evaluating the right one (False for '&&', True for '||');
+    it is None for operators that evaluate every operand. python is the
+    Python operator with the same meaning, if there is one.
+    """
+    __slots__ = ('token_type', 'symbol', 'arity', 'precedence', 'function', 'short_circuit', 'python')
+
+    def __init__(self, token_type, symbol, arity, precedence, function, short_circuit=None, python=None):
+        self.token_type = token_type
+        self.symbol = symbol
+        self.arity = arity
+        self.precedence = precedence
+        self.function = function
+        self.short_circuit = short_circuit
+        self.python = python
+
+    def __repr__(self):
+        return f"Operator({self.symbol!r}, arity={self.arity}, precedence={self.precedence})"
+
+
+OPERATORS = {}  # TokenType -> Operator
+
+# Tables derived from OPERATORS by register(), for the lookups made while parsing and running
+BINARY_LEVELS = {}  # TokenType -> precedence, for binary operators
+PREFIX_OPERATORS = {}  # TokenType -> Operator, for unary operators
+STRICT_OPERATORS = {}  # TokenType -> function, for binary operators that evaluate both operands
+SHORT_CIRCUIT = {}  # TokenType -> short_circuit, for '&&' and '||'
+ARITHMETIC_OPERATORS = set()  # binary operators binding at the additive level or tighter
+
+
+def register(token_type, symbol, arity, precedence, function, short_circuit=None, python=None):
+    """Add an operator to the registry, or replace one, and return it.
+
+    The lexer must already produce token_type for the operator's symbol; the
+    parser, the optimizer and the execution engines then handle it from its
+    entry here. Binary operators are left associative.
+    """
+    op = OPERATORS[token_type] = Operator(token_type, symbol, arity, precedence, function, short_circuit, python)
+    for table in (BINARY_LEVELS, PREFIX_OPERATORS, STRICT_OPERATORS, SHORT_CIRCUIT):
+        table.pop(token_type, None)
+    ARITHMETIC_OPERATORS.discard(token_type)
+    if arity == 1:
+        PREFIX_OPERATORS[token_type] = op
+        return op
+    BINARY_LEVELS[token_type] = precedence
+    if short_circuit is None:
+        STRICT_OPERATORS[token_type] = function
+    else:
+        SHORT_CIRCUIT[token_type] = short_circuit
+    if precedence >= ADDITIVE_LEVEL:
+        ARITHMETIC_OPERATORS.add(token_type)
+    return op
+
+
+register(TokenType.AND, '&&', 2, BOOLEAN_LEVEL, lambda left, right: left and right, short_circuit=False, python='and')
+register(TokenType.OR, '||', 2, BOOLEAN_LEVEL, lambda left, right: left or right, short_circuit=True, python='or')
+register(TokenType.EQUAL, '==', 2, COMPARISON_LEVEL, operator.eq, python='==')
+register(TokenType.NOT_EQUAL, '!=', 2, COMPARISON_LEVEL, operator.ne, python='!=')
+register(TokenType.GREATER_THAN, '>', 2, COMPARISON_LEVEL, operator.gt, python='>')
+register(TokenType.LESS_THAN, '<', 2, COMPARISON_LEVEL, operator.lt, python='<')
+register(TokenType.GREATER_THAN_OR_EQUAL, '>=', 2, COMPARISON_LEVEL, operator.ge, python='>=')
+register(TokenType.LESS_THAN_OR_EQUAL, '<=', 2, COMPARISON_LEVEL, operator.le, python='<=')
+register(TokenType.PLUS, '+', 2, ADDITIVE_LEVEL, operator.add, python='+')
+register(TokenType.MINUS, '-', 2, ADDITIVE_LEVEL, operator.sub, python='-')
+register(TokenType.MULTIPLY, '*', 2, MULTIPLICATIVE_LEVEL, operator.mul, python='*')
+# '/' is whole number division in the language
+register(TokenType.DIVIDE, '/', 2, MULTIPLICATIVE_LEVEL, operator.floordiv, python='//')
+register(TokenType.MODULO, '%', 2, MULTIPLICATIVE_LEVEL, operator.mod, python='%')
+register(TokenType.NOT, '!', 1, PREFIX_LEVEL, operator.not_, python='not')
@@ -0,0 +1,424 @@
+from collections import Counter
+
+from lexer import TokenType
+from operators import ARITHMETIC_OPERATORS, PREFIX_OPERATORS, SHORT_CIRCUIT, STRICT_OPERATORS
+from parserR import (NodeVisitor, Number, Boolean, Variable, BinaryOp, UnaryOp, IfElse, FunctionDef, FunctionCall,
+                     LambdaExpression)
+
+INLINE_BUDGET = 12  # largest function body, in nodes, copied into its call sites
+MAX_FOLD_BITS = 256  # largest integer, in bits, used or produced by a folded operation
+
+
+def is_constant(node):
+    return type(node) is Number or type(node) is Boolean
+
+
+def constant(value):
+    return Boolean(value) if isinstance(value, bool) else Number(value)
+
+
+def is_integer(node):
+    # Arithmetic always yields an int, even on booleans (True * 1 is 1)
+    return type(node) is Number or (type(node) is BinaryOp and node.op.type in ARITHMETIC_OPERATORS)
+
+
+def is_number_or_boolean(node):
+    # Operators only ever yield numbers or booleans; a variable or call may hold a function or None
+    node_type = type(node)
+    if node_type is Boolean or node_type is UnaryOp or is_integer(node):
+        return True
+    if node_type is BinaryOp:
+        if node.op.type in SHORT_CIRCUIT:
+            return is_number_or_boolean(node.left) and is_number_or_boolean(node.right)
+        return True
+    if node_type is IfElse:
+        return (node.else_branch is not None and is_number_or_boolean(node.if_branch)
+                and is_number_or_boolean(node.else_branch))
+    return False
+
+
+def is_small(value):
+    # Larger integers are left to the run, where the interpreter's limits apply to them
+    return value.__class__ is not int or value.bit_length() <= MAX_FOLD_BITS
+
+
+def is_atom(node):
+    return is_constant(node) or type(node) is Variable
+
+
+def children(node):
+    node_type = type(node)
+    if node_type is BinaryOp:
+        return [node.left, node.right]
+    if node_type is UnaryOp:
+        return [node.expr]
+    if node_type is IfElse:
+        return [node.condition, node.if_branch] + ([] if node.else_branch is None else [node.else_branch])
+    if node_type is FunctionCall:
+        return list(node.arguments)
+    if node_type is LambdaExpression:
+        return list(node.args) + [node.body]
+    if node_type is FunctionDef:
+        return [node.body]
+    return []
+
+
+def subtrees(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(children(node))
+
+
+def free_variables(node):
+    if type(node) is Variable:
+        return {node.name}
+    if type(node) is FunctionDef:
+        return set()  # a function body only sees its own parameters
+    if type(node) is LambdaExpression:
+        names = free_variables(node.body) - set(node.params)
+        for arg in node.args:
+            names |= free_variables(arg)
+        return names
+    names = set()
+    for child in children(node):
+        names |= free_variables(child)
+    return names
+
+
+class Substitution(NodeVisitor):
+    """Copies a tree, replacing the free variables named in the mapping with the given atoms.
+
+    Every Variable in the copy is a new node, so the resolver can give each copy
+    of an inlined body its own depth and slot.
+    """
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    def visit_Number(self, node):
+        return node
+
+    def visit_Boolean(self, node):
+        return node
+
+    def visit_Variable(self, node):
+        replacement = self.mapping.get(node.name, node)
+        return Variable(replacement.name) if type(replacement) is Variable else replacement
+
+    def visit_BinaryOp(self, node):
+        return BinaryOp(self.visit(node.left), node.op, self.visit(node.right))
+
+    def visit_UnaryOp(self, node):
+        return UnaryOp(node.op, self.visit(node.expr))
+
+    def visit_IfElse(self, node):
+        else_branch = None if node.else_branch is None else self.visit(node.else_branch)
+        return IfElse(self.visit(node.condition), self.visit(node.if_branch), else_branch)
+
+    def visit_FunctionCall(self, node):
+        return FunctionCall(node.name, [self.visit(arg) for arg in node.arguments])
+
+    def visit_FunctionDef(self, node):
+        return FunctionDef(node.name, node.arguments, Substitution({}).visit(node.body))
+
+    def visit_LambdaExpression(self, node):
+        args = [self.visit(arg) for arg in node.args]
+        inner = {name: atom for name, atom in self.mapping.items() if name not in node.params}
+        return LambdaExpression(node.params, args, Substitution(inner).visit(node.body))
+
+
+class Optimizer(NodeVisitor):
+    """Simplifies the AST between parsing and interpretation.
+
+    Operators whose operands are all literals are folded into a literal,
+    '&&'/'||' with a literal left operand and if/else with a literal condition
+    keep only the part that would run, and x*1, 1*x, x+0, 0+x and x-0 become x.
+    An operation that fails (such as 10/0), or that uses or produces an
+    integer of more than MAX_FOLD_BITS bits, is left in place so the error or
+    the interpreter's limits still apply when the program runs.
+
+    A lambda applied to literals or to variables has those arguments
+    substituted into its body, so `Lambd x.(x + 5)(6)` becomes 11. With
+    inline_functions, which needs the whole program, calls to small functions
+    that call nothing are replaced by their body as well. Only the definition
+    in force at that point of the program is used, and only names that are
+    never defined inside an expression are inlined; inside a function body the
+    callee must also be defined exactly once, since the body may run after any
+    later statement.
+
+    x*1 is True, not 1, when x is True, so the identities are only applied
+    where that cannot be observed: when x is known to be an integer, or when
+    x is known to be a number or boolean and the value is itself an operand
+    of arithmetic or a comparison, or is only tested for truth. A variable or
+    call may hold a function or None, where x*1 fails at run time, so it is
+    never simplified away.
+    """
+
+    def __init__(self, inline_functions=False, inline_budget=INLINE_BUDGET):
+        self.numeric_context = False  # True while the value only matters as a number or truth value
+        self.inline_functions = inline_functions
+        self.inline_budget = inline_budget
+        self.scopes = []  # parameter lists of the enclosing function and lambdas
+        self.functions = {}  # name -> top-level definition in force at the current statement
+        self.definition_counts = Counter()
+        self.nested_definitions = set()  # names defined inside an expression
+
+    def optimize(self, tree):
+        if not isinstance(tree, list):
+            return self.visit_operand(tree, False)
+
+        for statement in tree:
+            for node in subtrees(statement):
+                if type(node) is FunctionDef:
+                    if node is statement:
+                        self.definition_counts[node.name] += 1
+                    else:
+                        self.nested_definitions.add(node.name)
+
+        optimized = []
+        for statement in tree:
+            statement = self.visit_operand(statement, False)
+            if type(statement) is FunctionDef:
+                self.functions[statement.name] = statement
+            optimized.append(statement)
+        return optimized
+
+    def visit_operand(self, node, numeric_context):
+        outer = self.numeric_context
+        self.numeric_context = numeric_context
+        try:
+            return self.visit(node)
+        finally:
+            self.numeric_context = outer
+
+    def visit_BinaryOp(self, node):
+        op_type = node.op.type
+        # The value of '&&'/'||' is one of its operands, so they inherit the context
+        numeric = self.numeric_context if op_type in SHORT_CIRCUIT else True
+        left = self.visit_operand(node.left, numeric)
+        right = self.visit_operand(node.right, numeric)
+
+        if op_type in SHORT_CIRCUIT:
+            if is_constant(left):
+                # Mirrors `left or right` / `left and right`
+                return left if SHORT_CIRCUIT[op_type] == bool(left.value) else right
+        elif (is_constant(left) and is_constant(right) and op_type in STRICT_OPERATORS
+              and is_small(left.value) and is_small(right.value)):
+            try:
+                value = STRICT_OPERATORS[op_type](left.value, right.value)
+            except Exception:
+                pass  # keep the operation, it fails again at run time
+            else:
+                if is_small(value):
+                    return constant(value)
+        else:
+            simplified = self.simplify_identity(op_type, left, right)
+            if simplified is not None:
+                return simplified
+
+        if left is node.left and right is node.right:
+            return node
+        return BinaryOp(left, node.op, right)
+
+    def simplify_identity(self, op_type, left, right):
+        def is_literal(operand, value):
+            return type(operand) is Number and operand.value == value
+
+        def keeps_value(operand):
+            return is_integer(operand) or (self.numeric_context and is_number_or_boolean(operand))
+
+        if op_type == TokenType.MULTIPLY:
+            if is_literal(right, 1) and keeps_value(left):
+                return left
+            if is_literal(left, 1) and keeps_value(right):
+                return right
+        elif op_type == TokenType.PLUS:
+            if is_literal(right, 0) and keeps_value(left):
+                return left
+            if is_literal(left, 0) and keeps_value(right):
+                return right
+        elif op_type == TokenType.MINUS:
+            if is_literal(right, 0) and keeps_value(left):
+                return left
+        return None
+
+    def visit_UnaryOp(self, node):
+        expr = self.visit_operand(node.expr, True)
+        if node.op.type in PREFIX_OPERATORS and is_constant(expr) and is_small(expr.value):
+            try:
+                value = PREFIX_OPERATORS[node.op.type].function(expr.value)
+            except Exception:
+                pass  # keep the operation, it fails again at run time
+            else:
+                if is_small(value):
+                    return constant(value)
+        return node if expr is node.expr else UnaryOp(node.op, expr)
+
+    def visit_Number(self, node):
+        return node
+
+    def visit_Boolean(self, node):
+        return node
+
+    def visit_Variable(self, node):
+        return node
+
+    def visit_FunctionDef(self, node):
+        outer = self.scopes
+        self.scopes = [node.arguments]
+        try:
+            body = self.visit_operand(node.body, False)
+        finally:
+            self.scopes = outer
+        return node if body is node.body else FunctionDef(node.name, node.arguments, body)
+
+    def visit_IfElse(self, node):
+        condition = self.visit_operand(node.condition, True)
+        if_branch = self.visit(node.if_branch)
+        else_branch = None if node.else_branch is None else self.visit(node.else_branch)
+        if is_constant(condition):
+            if condition.value:
+                return if_branch
+            if else_branch is not None:
+                return else_branch
+        if condition is node.condition and if_branch is node.if_branch and else_branch is node.else_branch:
+            return node
+        return IfElse(condition, if_branch, else_branch)
+
+    def visit_FunctionCall(self, node):
+        arguments = [self.visit_operand(arg, False) for arg in node.arguments]
+        func = self.inline_candidate(node.name, len(arguments))
+        if func is not None:
+            body = Substitution({}).visit(func.body)
+            reduced = self.beta_reduce(func.arguments, arguments, body)
+            return LambdaExpression(func.arguments, arguments, body) if reduced is None else reduced
+        if all(new is old for new, old in zip(arguments, node.arguments)):
+            return node
+        return FunctionCall(node.name, arguments)
+
+    def inline_candidate(self, name, argc):
+        if not self.inline_functions or name in self.nested_definitions:
+            return None
+        func = self.functions.get(name)
+        if func is None or len(func.arguments) != argc:
+            return None
+        if self.scopes and self.definition_counts[name] != 1:
+            return None
+        body = list(subtrees(func.body))
+        if len(body) > self.inline_budget:
+            return None
+        if any(type(part) is FunctionCall or type(part) is FunctionDef for part in body):
+            return None  # calls nothing, so it cannot be recursive
+        if not free_variables(func.body) <= set(func.arguments):
+            return None
+        return func
+
+    def visit_LambdaExpression(self, node):
+        args = [self.visit_operand(arg, False) for arg in node.args]
+        self.scopes.append(node.params)
+        try:
+            body = self.visit(node.body)
+        finally:
+            self.scopes.pop()
+        reduced = self.beta_reduce(node.params, args, body)
+        if reduced is not None:
+            return reduced
+        if body is node.body and all(new is old for new, old in zip(args, node.args)):
+            return node
+        return LambdaExpression(node.params, args, body)
+
+    def beta_reduce(self, params, args, body):
+        """Substitutes the atomic arguments of a lambda application into its body.
+
+        Other arguments may fail or be expensive, so they stay as a lambda
+        around the new body and are still evaluated once, in order. A variable
+        is only moved into the body if it is a parameter in scope here and no
+        lambda in the body binds the same name. Returns None if nothing can be
+        substituted.
+        """
+        if len(params) != len(args) or len(set(params)) != len(params):
+            return None
+
+        bound = {param for part in subtrees(body) if type(part) is LambdaExpression for param in part.params}
+        local = {name for scope in self.scopes for name in scope}
+        mapping = {}
+        for param, arg in zip(params, args):
+            if is_constant(arg) or (type(arg) is Variable and arg.name in local and arg.name not in bound):
+                mapping[param] = arg
+        while True:
+            # A variable must not end up under one of the parameters that stay
+            kept = {param for param in params if param not in mapping}
+            captured = [param for param, arg in mapping.items() if type(arg) is Variable and arg.name in kept]
+            if not captured:
+                break
+            for param in captured:
+                del mapping[param]
+        if not mapping:
+            return None
+
+        kept = [(param, arg) for param, arg in zip(params, args) if param not in mapping]
+        body = Substitution(mapping).visit(body)
+        if not kept:
+            return self.visit(body)
+        self.scopes.append([param for param, _ in kept])
+        try:
+            body = self.visit(body)
+        finally:
+            self.scopes.pop()
+        return LambdaExpression([param for param, _ in kept], [arg for _, arg in kept], body)
+
+
+# Test the optimizer: every program must give the same values and errors once optimized
+def test_optimizer():
+    from interpreter import Interpreter
+    from lexer import Lexer
+    from parserR import Parser
+
+    test_cases = [
+        "1 + 2 * 3 - 4 / 2",
+        "Lambd x.(x + 5)(6)",
+        "Lambd b.(b * 1)(1 == 1)",
+        "Lambd b.((b * 1) == 1)(1 == 1)",
+        "Defun {f, (x)} (x + 0) == 0\nf((if (False) {1}))",
+        "Defun {k, (x)} (x * 1) == 1\nk(k)",
+        "Defun {g, (x)} if ((1 * (x < 1)) == 1) {0 + (x == 0)} else {x - 0}\ng(0)\ng(5)",
+    ]
+
+    def outcomes(statements):
+        interpreter = Interpreter()
+        interpreter.resolve(statements)
+        results = []
+        for statement in statements:
+            try:
+                results.append(interpreter.visit(statement))
+            except Exception as e:
+                results.append(f"error: {e}")
+        return results
+
+    for case in test_cases:
+        print(f"\nOptimizing: {case!r}")
+        expected = outcomes(Parser(Lexer(case)).parse())
+        optimized = Optimizer(inline_functions=True).optimize(Parser(Lexer(case)).parse())
+        result = outcomes(optimized)
+        print(f"Result: {result}" if result == expected else f"Mismatch: {result}, expected {expected}")
+
+    # Squaring 3 31 times would compute 3**(2**31) while optimizing; the
+    # interpreter's integer size limit must stop it at run time instead
+    case = "3"
+    for _ in range(31):
+        case = f"Lambd x.(x * x)({case})"
+    print("\nOptimizing 31 nested squarings with --max-int-bits 64")
+    optimized = Optimizer().optimize(Parser(Lexer(case)).parse())
+    interpreter = Interpreter()
+    interpreter.set_limits(max_int_bits=64)
+    interpreter.resolve(optimized)
+    try:
+        print(f"Mismatch: {interpreter.visit(optimized[0])}, expected an integer size error")
+    except Exception as e:
+        print(f"Result: error: {e}")
+
+
+if __name__ == "__main__":
+    test_optimizer()
@@ -0,0 +1,151 @@
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+from optimizer import subtrees
+from parserR import FunctionDef
+from resolver import Resolver
+
+MAX_BATCH = 256  # most statements sent to a worker at once
+
+# Per worker process, set up by load_worker()
+_create = None
+_definitions = ()
+_interpreter = None
+_version = 0  # number of definitions _interpreter has run
+
+
+def is_independent(statement):
+    """True for an expression that only reads the function table, so it can run in any process."""
+    return not any(type(node) is FunctionDef for node in subtrees(statement))
+
+
+def can_run_in_parallel(statements):
+    return all(type(statement) is FunctionDef or is_independent(statement) for statement in statements)
+
+
+def load_worker(create, definitions):
+    global _create, _definitions, _interpreter, _version
+    # Ctrl-C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _create = create
+    _definitions = definitions
+    # The bodies are installed without being run through interpret(), so they are resolved here
+    Resolver(late_binding=True).resolve(list(definitions))
+    _interpreter, _version = None, 0
+
+
+def interpreter_for(version):
+    """Return the worker's interpreter holding exactly the first `version` definitions.
+
+    Batches mostly arrive in program order, so the interpreter is moved
+    forward by running the definitions it has not seen yet. It is only
+    rebuilt when a batch from earlier in the program comes after a later one.
+    """
+    global _interpreter, _version
+    if _interpreter is None or version < _version:
+        _interpreter = _create()
+        _version = 0
+    for func in _definitions[_version:version]:
+        _interpreter.visit_FunctionDef(func)
+    _version = version
+    return _interpreter
+
+
+def evaluate_batch(version, statements):
+    interpreter = interpreter_for(version)
+    outcomes = []
+    for statement in statements:
+        try:
+            interpreter.resolve(statement)
+            interpreter.reset_limits()
+            outcomes.append(('ok', interpreter.visit(statement)))
+        except Exception as e:
+            outcomes.append(('err', str(e)))
+    return outcomes
+
+
+def evaluate_batch_counting(version, statements):
+    """evaluate_batch(), also returning the memo cache hits and misses the batch made."""
+    memo = interpreter_for(version).memo
+    if memo is None:
+        return evaluate_batch(version, statements), 0, 0
+    hits, misses = memo.hits, memo.misses
+    outcomes = evaluate_batch(version, statements)
+    return outcomes, memo.hits - hits, memo.misses - misses
+
+
+def evaluate_parallel(statements, jobs, create, memo_counts=None):
+    """Evaluate the expressions of a program in a pool of worker processes.
+
+    Every worker gets all top-level definitions up front and runs each
+    expression with the definitions that precede it in the program, so
+    redefinitions are seen exactly as in a sequential run. Yields, in program
+    order, None for a definition and ('ok', value) or ('err', message) for an
+    expression. The statements must satisfy can_run_in_parallel() and
+    create() must be picklable. The 'hits' and 'misses' of the workers' memo
+    caches are added to the memo_counts Counter, if one is given, as their
+    results come in.
+    """
+    definitions = [statement for statement in statements if type(statement) is FunctionDef]
+    batch_size = max(1, min(MAX_BATCH, len(statements) // (jobs * 4)))
+
+    with ProcessPoolExecutor(jobs, initializer=load_worker, initargs=(create, definitions)) as pool:
+        plan = []  # per statement: None for a definition, or (batch future, index in the batch)
+        batch = []
+        version = 0
+
+        def submit():
+            future = pool.submit(evaluate_batch_counting, version, list(batch))
+            plan.extend((future, index) for index in range(len(batch)))
+            batch.clear()
+
+        for statement in statements:
+            if type(statement) is FunctionDef:
+                if batch:
+                    submit()
+                version += 1
+                plan.append(None)
+            else:
+                batch.append(statement)
+                if len(batch) == batch_size:
+                    submit()
+        if batch:
+            submit()
+
+        for entry in plan:
+            if entry is None:
+                yield None
+            else:
+                future, index = entry
+                outcomes, hits, misses = future.result()
+                if index == 0 and memo_counts is not None:
+                    memo_counts.update(hits=hits, misses=misses)
+                yield outcomes[index]
+
+
+# Test parallel evaluation: every program must print the same as a sequential run
+def test_parallel():
+    from interpreter import Interpreter
+    from lexer import Lexer
+    from optimizer import Optimizer
+    from parserR import Parser
+
+    test_cases = [
+        "Defun {add, (x, y)} x + y\nadd(1, 2)\nDefun {add, (x, y)} x * y\nadd(3, 4)",
+        # Inlining puts new variables into g's body, which the workers must resolve
+        "Defun {sq, (x)} x * x\nDefun {g, (a)} sq(a) + sq(a) + sq(a) + sq(a) + a * 1 * 2 * 3 * 4 * 5\n"
+        "g(3)\ng(4)\ng(5)\ng(6)",
+    ]
+
+    for case in test_cases:
+        print(f"\nEvaluating with -O -j 2: {case!r}")
+        interpreter = Interpreter()
+        expected = [interpreter.interpret(statement) for statement in Parser(Lexer(case)).parse()]
+        statements = Optimizer(inline_functions=True).optimize(Parser(Lexer(case)).parse())
+        Interpreter().resolve(statements)
+        result = [None if outcome is None else outcome[1] for outcome in evaluate_parallel(statements, 2, Interpreter)]
+        print(f"Result: {result}" if result == expected else f"Mismatch: {result}, expected {expected}")
+
+
+if __name__ == "__main__":
+    test_parallel()
@@ -1,24 +1,60 @@
 from lexer import Lexer, TokenType
+from operators import (ADDITIVE_LEVEL, ARITHMETIC_OPERATORS, BINARY_LEVELS, BOOLEAN_LEVEL, COMPARISON_LEVEL,
+                       MULTIPLICATIVE_LEVEL, PREFIX_LEVEL, PREFIX_OPERATORS)
+
+# Bump whenever the AST produced for a given source text changes, so that
+# cached parse results (see compile_cache.py) are not reused.
+GRAMMAR_VERSION = 3
 
 
 class ParserError(Exception):
     pass
 
 
+class NodeVisitor:
+    """Base of the passes over the AST: visit(node) calls the visit_<node class name> method.
+
+    Every visitor class keeps its own table from node class to method, filled
+    in the first time it meets each node class, so a visit costs one dict
+    lookup instead of building the method name and looking it up by string.
+    """
+    visit_methods = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.visit_methods = {}  # node class -> function taking (visitor, node)
+
+    @classmethod
+    def visit_method(cls, node_class):
+        method = getattr(cls, f'visit_{node_class.__name__}', None)
+        if method is None:
+            raise Exception(f'No visit_{node_class.__name__} method defined')
+        cls.visit_methods[node_class] = method
+        return method
+
+    def visit(self, node):
+        method = self.visit_methods.get(node.__class__)
+        if method is None:
+            method = self.visit_method(node.__class__)
+        return method(self, node)
+
+
 class ASTNode:
-    def accept(self, visitor):
-        method_name = f'visit_{type(self).__name__}'
-        visit = getattr(visitor, method_name, self.generic_visit)
-        return visit(self)
+    __slots__ = ()
 
-    def generic_visit(self, visitor):
-        raise Exception(f'No visit_{type(self).__name__} method defined')
+    def accept(self, visitor):
+        method = visitor.visit_methods.get(self.__class__)
+        if method is None:
+            method = visitor.visit_method(self.__class__)
+        return method(visitor, self)
 
     def __repr__(self):
         return self.__str__()
 
 
 class BinaryOp(ASTNode):
+    __slots__ = ('left', 'op', 'right')
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
@@ -29,6 +65,8 @@ class BinaryOp(ASTNode):
 
 
 class UnaryOp(ASTNode):
+    __slots__ = ('op', 'expr')
+
     def __init__(self, op, expr):
         self.op = op
         self.expr = expr
@@ -38,6 +76,8 @@ class UnaryOp(ASTNode):
 
 
 class Number(ASTNode):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
@@ -46,6 +86,8 @@ class Number(ASTNode):
 
 
 class Boolean(ASTNode):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
@@ -54,6 +96,8 @@ class Boolean(ASTNode):
 
 
 class FunctionDef(ASTNode):
+    __slots__ = ('name', 'arguments', 'body')
+
     def __init__(self, name, arguments, body):
         self.name = name
         self.arguments = arguments
@@ -64,6 +108,8 @@ class FunctionDef(ASTNode):
 
 
 class FunctionCall(ASTNode):
+    __slots__ = ('name', 'arguments')
+
     def __init__(self, name, arguments):
         self.name = name
         self.arguments = arguments
@@ -73,14 +119,22 @@ class FunctionCall(ASTNode):
 
 
 class Variable(ASTNode):
+    __slots__ = ('name', 'depth', 'slot')
+
     def __init__(self, name):
         self.name = name
+        # Filled in by the resolver: how many frames to walk out and the slot in
+        # that frame. depth None means a global (function) name.
+        self.depth = None
+        self.slot = None
 
     def __repr__(self):
         return f'{self.name}'
 
 
 class LambdaExpression(ASTNode):
+    __slots__ = ('params', 'args', 'body')
+
     def __init__(self, params, args, body):
         self.params = params
         self.args = args
@@ -90,6 +144,8 @@ class LambdaExpression(ASTNode):
         return f"(Lambd {self.params} . {self.body} , {self.args})"
 
 class IfElse(ASTNode):
+    __slots__ = ('condition', 'if_branch', 'else_branch')
+
     def __init__(self, condition, if_branch, else_branch=None):
         self.condition = condition
         self.if_branch = if_branch
@@ -101,6 +157,8 @@ class IfElse(ASTNode):
         return f"If({self.condition}) {{ {self.if_branch} }}"
 
 
+OPEN_PAREN = (0, None)  # operator stack entry for an unclosed '('; below every level
+
 
 class Parser:
     def __init__(self, lexer):
@@ -108,7 +166,8 @@ class Parser:
         self.current_token = self.lexer.get_next_token()
 
     def error(self, details=None):
-        red_det = f"Syntax error: {details}, at {self.lexer.pos} position."
+        line, column = self.lexer.line_col(self.current_token.pos)
+        red_det = f"Syntax error: {details}, at line {line}, column {column}."
         if details:
             raise Exception(red_det)
         raise Exception('Invalid syntax')
@@ -124,24 +183,31 @@ class Parser:
             self.error(f"Expected {token_type}, found {self.current_token.type}")
 
     def factor(self):
+        return self.operator_expr(PREFIX_LEVEL)
+
+    def term(self):
+        return self.operator_expr(MULTIPLICATIVE_LEVEL)
+
+    def arithmetic_expr(self):
+        return self.operator_expr(ADDITIVE_LEVEL)
+
+    def comparison_expr(self):
+        return self.operator_expr(COMPARISON_LEVEL)
+
+    def boolean_expr(self):
+        return self.operator_expr(BOOLEAN_LEVEL)
+
+    def operand(self):
+        """Parse a literal, a variable or a function call."""
         token = self.current_token
         if token.type == TokenType.INTEGER:
             self.eat(TokenType.INTEGER)
             return Number(token.value)
         elif token.type == TokenType.BOOLEAN:
             self.eat(TokenType.BOOLEAN)
-            if self.current_token.type in (
-                    TokenType.PLUS, TokenType.MINUS, TokenType.MULTIPLY, TokenType.DIVIDE, TokenType.MODULO):
+            if self.current_token.type in ARITHMETIC_OPERATORS:
                 self.error("Cannot use boolean in arithmetic expression")
             return Boolean(token.value)
-        elif token.type == TokenType.LPAREN:
-            self.eat(TokenType.LPAREN)
-            node = self.expr()
-            self.eat(TokenType.RPAREN)
-            return node
-        elif token.type == TokenType.NOT:
-            self.eat(TokenType.NOT)
-            return UnaryOp(token, self.factor())
         elif token.type == TokenType.IDENTIFIER:
             name = token.value
             self.eat(TokenType.IDENTIFIER)
@@ -152,50 +218,80 @@ class Parser:
         else:
             self.error(f"Unexpected token {token.type} in factor")
 
-    def term(self):
-        node = self.factor()
-        while self.current_token.type in (TokenType.MULTIPLY, TokenType.DIVIDE, TokenType.MODULO):
-            token = self.current_token
-            if token.type == TokenType.MULTIPLY:
-                self.eat(TokenType.MULTIPLY)
-            elif token.type == TokenType.DIVIDE:
-                self.eat(TokenType.DIVIDE)
-            elif token.type == TokenType.MODULO:
-                self.eat(TokenType.MODULO)
-            node = BinaryOp(left=node, op=token, right=self.factor())
-        return node
-
-    def arithmetic_expr(self):
-        node = self.term()
-        while self.current_token.type in (TokenType.PLUS, TokenType.MINUS):
-            token = self.current_token
-            if token.type == TokenType.PLUS:
-                self.eat(TokenType.PLUS)
-            elif token.type == TokenType.MINUS:
-                self.eat(TokenType.MINUS)
-            right = self.term()
-            if isinstance(right, Boolean):
+    def operator_expr(self, min_level):
+        """Parse operators binding at least as tightly as min_level, without recursion.
+
+        Operands and pending operators are kept on explicit stacks, so long
+        chains, deep parentheses and repeated '!' take no Python stack. An
+        operator is applied as soon as one of the same or a lower level
+        follows, which makes every binary operator left associative. Inside
+        parentheses all levels are allowed again. The trees and syntax errors
+        are the same as those of the recursive descent this replaces, which
+        had one method per level (boolean_expr down to factor).
+        """
+        # The lexer never returns INVALID tokens, so the loop below advances
+        # without going through eat() for the tokens it has already checked.
+        next_token = self.lexer.get_next_token
+        operands = []
+        operators = []  # (level, token) pairs, with OPEN_PAREN where a '(' group starts
+        group_levels = [min_level]  # lowest level allowed in each open group
+        floor = min_level
+
+        while True:
+            # An operand, after any number of '!' and '('
+            while True:
+                token = self.current_token
+                token_type = token.type
+                if token_type == TokenType.INTEGER:
+                    self.current_token = next_token()
+                    node = Number(token.value)
+                    break
+                elif token_type in PREFIX_OPERATORS:
+                    self.current_token = next_token()
+                    operators.append((PREFIX_OPERATORS[token_type].precedence, token))
+                elif token_type == TokenType.LPAREN:
+                    self.current_token = next_token()
+                    if self.current_token.type in (TokenType.DEFUN, TokenType.LAMBD, TokenType.IF):
+                        node = self.expr()
+                        self.eat(TokenType.RPAREN)
+                        break
+                    operators.append(OPEN_PAREN)
+                    group_levels.append(BOOLEAN_LEVEL)
+                    floor = BOOLEAN_LEVEL
+                else:
+                    node = self.operand()
+                    break
+            operands.append(node)
+
+            # A binary operator, after closing any groups that end here
+            while True:
+                token = self.current_token
+                level = BINARY_LEVELS.get(token.type)
+                if level is not None and level >= floor:
+                    if operators and operators[-1][0] >= level:
+                        self.reduce(operands, operators, level)
+                    self.current_token = next_token()
+                    operators.append((level, token))
+                    break
+                self.reduce(operands, operators, floor)
+                if len(group_levels) == 1:
+                    return operands.pop()
+                self.eat(TokenType.RPAREN)
+                operators.pop()
+                group_levels.pop()
+                floor = group_levels[-1]
+
+    def reduce(self, operands, operators, level):
+        """Apply the pending operators of the given level or above, down to the innermost open group."""
+        while operators and operators[-1][0] >= level:
+            token = operators.pop()[1]
+            if token.type in PREFIX_OPERATORS:
+                operands.append(UnaryOp(token, operands.pop()))
+                continue
+            right = operands.pop()
+            if BINARY_LEVELS[token.type] == ADDITIVE_LEVEL and isinstance(right, Boolean):
                 self.error("Cannot perform arithmetic operations with boolean values")
-            node = BinaryOp(left=node, op=token, right=right)
-        return node
-
-    def comparison_expr(self):
-        node = self.arithmetic_expr()
-        while self.current_token.type in (TokenType.EQUAL, TokenType.NOT_EQUAL,
-                                          TokenType.GREATER_THAN, TokenType.LESS_THAN,
-                                          TokenType.GREATER_THAN_OR_EQUAL, TokenType.LESS_THAN_OR_EQUAL):
-            token = self.current_token
-            self.eat(self.current_token.type)
-            node = BinaryOp(left=node, op=token, right=self.arithmetic_expr())
-        return node
-
-    def boolean_expr(self):
-        node = self.comparison_expr()
-        while self.current_token.type in (TokenType.AND, TokenType.OR):
-            token = self.current_token
-            self.eat(self.current_token.type)
-            node = BinaryOp(left=node, op=token, right=self.comparison_expr())
-        return node
+            operands.append(BinaryOp(left=operands.pop(), op=token, right=right))
 
     def expr(self):
         if self.current_token.type == TokenType.DEFUN:
@@ -296,12 +392,14 @@ class Parser:
         return LambdaExpression(params, args, body)
 
     def parse_program(self):
-        statements = []
+        return list(self.iter_statements())
+
+    def iter_statements(self):
+        """Yield the statements of the program one at a time, as soon as each is parsed."""
         while self.current_token.type != TokenType.EOF:
-            statements.append(self.expr())
+            yield self.expr()
             if self.current_token.type == TokenType.NEWLINE:
                 self.eat(TokenType.NEWLINE)
-        return statements
 
     def expr(self):
         if self.current_token.type == TokenType.DEFUN:
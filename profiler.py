@@ -0,0 +1,170 @@
+import time
+from collections import Counter, defaultdict
+
+from interpreter import Environment, Interpreter, TailCall
+from operators import SHORT_CIRCUIT
+from parserR import BinaryOp, FunctionCall, IfElse, LambdaExpression
+
+TOP_LEVEL = '<top level>'
+
+
+class FunctionStats:
+    __slots__ = ('calls', 'total', 'self_time', 'active')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0  # inclusive time, counting recursive calls once
+        self.self_time = 0.0  # exclusive time
+        self.active = 0  # calls currently on the stack
+
+
+class Record:
+    """One running function call."""
+    __slots__ = ('stats', 'path', 'start', 'child_time')
+
+    def __init__(self, stats, path, start):
+        self.stats = stats
+        self.path = path  # names from the top level down to this call
+        self.start = start
+        self.child_time = 0.0
+
+
+class ProfilingInterpreter(Interpreter):
+    """Tree-walking interpreter that measures where a program spends its time.
+
+    For every Defun it counts calls and adds up inclusive and exclusive time,
+    and it counts the evaluations of each node type. A call in tail position
+    replaces its caller on the profile stack, just as it does on the real one.
+    Only this class pays for the bookkeeping; the plain Interpreter is left
+    untouched.
+    """
+
+    def __init__(self, collapsed_path=None):
+        super().__init__()
+        self.collapsed_path = collapsed_path  # where report() writes collapsed stacks, if anywhere
+        self.functions = defaultdict(FunctionStats)  # name -> FunctionStats
+        self.node_counts = Counter()  # node type name -> evaluations
+        self.stack_times = Counter()  # call path -> exclusive time, for flame graphs
+        self.function_bodies = {}  # body node -> name of the function it belongs to
+        self.stack = []  # Records of the running calls
+        self.tail_base = 0  # stack height when the innermost call_in_frame started
+        self.elapsed = 0.0
+        self.calls_time = 0.0  # time spent inside calls made from the top level
+
+    def visit(self, node):
+        self.node_counts[type(node).__name__] += 1
+        return node.accept(self)
+
+    def visit_FunctionDef(self, node):
+        self.function_bodies[node.body] = node.name
+        return super().visit_FunctionDef(node)
+
+    def enter(self, name):
+        parent_path = self.stack[-1].path if self.stack else (TOP_LEVEL,)
+        stats = self.functions[name]
+        stats.calls += 1
+        stats.active += 1
+        self.stack.append(Record(stats, parent_path + (name,), time.perf_counter()))
+
+    def leave(self):
+        record = self.stack.pop()
+        elapsed = time.perf_counter() - record.start
+        self_time = elapsed - record.child_time
+        stats = record.stats
+        stats.active -= 1
+        if not stats.active:
+            stats.total += elapsed
+        stats.self_time += self_time
+        self.stack_times[record.path] += self_time
+        if self.stack:
+            self.stack[-1].child_time += elapsed
+        else:
+            self.calls_time += elapsed
+
+    def call_in_frame(self, body, frame, memo_key=None):
+        # Lambda bodies have no record of their own; their time is their caller's
+        outer_base = self.tail_base
+        self.tail_base = len(self.stack)
+        name = self.function_bodies.get(body)
+        if name is not None:
+            self.enter(name)
+        try:
+            return super().call_in_frame(body, frame, memo_key)
+        finally:
+            while len(self.stack) > self.tail_base:
+                self.leave()
+            self.tail_base = outer_base
+
+    def visit_tail(self, node):
+        # Interpreter.visit_tail walks through these nodes without visit(), so
+        # they are walked here to count them, as it would walk them. The walk is
+        # repeated rather than hooked into the base class, which then pays
+        # nothing for profiling; keep the two in step.
+        counts = self.node_counts
+        while True:
+            node_type = type(node)
+            if node_type is IfElse:
+                counts['IfElse'] += 1
+                if self.visit(node.condition):
+                    node = node.if_branch
+                elif node.else_branch is not None:
+                    node = node.else_branch
+                else:
+                    return None
+            elif node_type is BinaryOp and node.op.type in SHORT_CIRCUIT:
+                counts['BinaryOp'] += 1
+                left = self.visit(node.left)
+                if SHORT_CIRCUIT[node.op.type] == bool(left):
+                    return left
+                node = node.right
+            elif node_type is LambdaExpression:
+                counts['LambdaExpression'] += 1
+                self.frame = Environment([self.visit(arg) for arg in node.args], self.frame)
+                node = node.body
+            else:
+                break
+        if node_type is FunctionCall:
+            counts['FunctionCall'] += 1
+
+        result = super().visit_tail(node)
+        if type(result) is TailCall:
+            # The callee takes the place of the call that is ending
+            while len(self.stack) > self.tail_base:
+                self.leave()
+            self.enter(self.function_bodies.get(result.body, '<unknown>'))
+        return result
+
+    def interpret(self, tree):
+        start = time.perf_counter()
+        calls_time = self.calls_time
+        try:
+            return super().interpret(tree)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.elapsed += elapsed
+            self.stack_times[(TOP_LEVEL,)] += elapsed - (self.calls_time - calls_time)
+
+    def report(self):
+        """Return the profile as text, and write the collapsed stacks if a path was given."""
+        lines = [f"Profile: {self.elapsed:.6f} s in total",
+                 f"{'function':<20} {'calls':>10} {'total s':>12} {'self s':>12} {'self %':>7}"]
+        by_self_time = sorted(self.functions.items(), key=lambda item: item[1].self_time, reverse=True)
+        for name, stats in by_self_time:
+            share = 100 * stats.self_time / self.elapsed if self.elapsed else 0.0
+            lines.append(f"{name:<20} {stats.calls:>10} {stats.total:>12.6f} {stats.self_time:>12.6f} {share:>7.1f}")
+        lines.append(f"{'node type':<20} {'evaluations':>11}")
+        for node_type, count in self.node_counts.most_common():
+            lines.append(f"{node_type:<20} {count:>11}")
+
+        if self.collapsed_path is not None:
+            self.write_collapsed_stacks(self.collapsed_path)
+            lines.append(f"Collapsed stacks written to {self.collapsed_path}")
+        return '\n'.join(lines)
+
+    def write_collapsed_stacks(self, path):
+        """Write one 'top;caller;callee microseconds' line per call path, the input of flamegraph.pl."""
+        with open(path, 'w') as file:
+            for stack, seconds in sorted(self.stack_times.items()):
+                microseconds = round(seconds * 1e6)
+                if microseconds > 0:
+                    file.write(f"{';'.join(stack)} {microseconds}\n")
@@ -0,0 +1,92 @@
+from parserR import NodeVisitor, FunctionDef
+
+
+class ResolverError(Exception):
+    pass
+
+
+class Resolver(NodeVisitor):
+    """Static pass run before execution that gives every Variable a frame address.
+
+    A Variable bound by an enclosing parameter list gets depth (frames to walk
+    out from the innermost call frame) and slot (the parameter position). A named
+    function body starts a fresh chain because it only sees its own arguments;
+    a lambda body extends the chain it is written in. Names that are neither
+    parameters nor functions are reported here instead of during the run.
+
+    With late_binding, an unknown name inside a function body is left as a
+    global instead, since the function it names may be defined by a later
+    statement before the body runs. This is for statements resolved one at a
+    time; a whole program knows all of its definitions up front.
+    """
+
+    def __init__(self, functions=(), late_binding=False):
+        # Read, not copied, since it is usually the interpreter's whole function table
+        self.functions = functions
+        self.late_binding = late_binding
+        self.defined = set()  # names of the functions defined by the resolved trees
+        self.scopes = []  # parameter lists of the enclosing calls, innermost last
+        self.in_function = False  # True inside the body of a FunctionDef
+
+    def resolve(self, tree):
+        statements = tree if isinstance(tree, list) else [tree]
+        # Top-level functions may be called (and named) before they are defined
+        self.defined.update(node.name for node in statements if isinstance(node, FunctionDef))
+        for node in statements:
+            self.visit(node)
+
+    def visit_BinaryOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_UnaryOp(self, node):
+        self.visit(node.expr)
+
+    def visit_Number(self, node):
+        pass
+
+    def visit_Boolean(self, node):
+        pass
+
+    def visit_Variable(self, node):
+        for depth, params in enumerate(reversed(self.scopes)):
+            if node.name in params:
+                # With repeated parameter names the last one wins, as it did with dicts
+                node.depth = depth
+                node.slot = len(params) - 1 - params[::-1].index(node.name)
+                return
+        if (node.name not in self.defined and node.name not in self.functions
+                and not (self.late_binding and self.in_function)):
+            raise ResolverError(f"Variable '{node.name}' is not defined")
+        node.depth = node.slot = None
+
+    def visit_FunctionDef(self, node):
+        self.defined.add(node.name)
+        outer_scopes, outer_in_function = self.scopes, self.in_function
+        self.scopes, self.in_function = [node.arguments], True
+        try:
+            self.visit(node.body)
+        finally:
+            self.scopes, self.in_function = outer_scopes, outer_in_function
+
+    def visit_FunctionCall(self, node):
+        for arg in node.arguments:
+            self.visit(arg)
+
+    def visit_LambdaExpression(self, node):
+        if len(node.args) != len(node.params):
+            raise ResolverError(
+                f"Lambda expects {len(node.params)} arguments, but got {len(node.args)}")
+        for arg in node.args:
+            self.visit(arg)
+        self.scopes.append(node.params)
+        try:
+            self.visit(node.body)
+        finally:
+            self.scopes.pop()
+
+    def visit_IfElse(self, node):
+        self.visit(node.condition)
+        self.visit(node.if_branch)
+        if node.else_branch is not None:
+            self.visit(node.else_branch)
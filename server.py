@@ -0,0 +1,212 @@
+import asyncio
+import json
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from compile_cache import load_program
+from interpreter import Interpreter
+from lexer import Lexer
+from parallel import evaluate_batch, is_independent, load_worker
+from parserR import FunctionDef, Parser
+
+BATCH_WINDOW = 0.002  # seconds to wait for more requests before sending a batch to the workers
+MAX_BATCH = 64
+MAX_LINE = 16 * 1024 * 1024  # longest request line, in bytes
+MAX_IN_FLIGHT = 1024  # requests of one connection being evaluated before the server stops reading more
+
+
+class RequestError(Exception):
+    pass
+
+
+class EvaluationServer:
+    """Evaluates expressions sent as line-delimited JSON against a preloaded function library.
+
+    Each request is a line such as {"id": 1, "expr": "add(2, 3)"} and is
+    answered with a line such as
+    {"id": 1, "ok": true, "result": 5, "latency_ms": 0.8}, or with "ok": false
+    and an "error" message. A connection may send several requests without
+    waiting; responses carry the id of their request and come back as soon as
+    each is done.
+
+    The expressions are run by a pool of worker processes that keep an
+    interpreter with the library loaded. Requests arriving within
+    BATCH_WINDOW of each other are sent to the workers together.
+    """
+
+    def __init__(self, definitions, create=Interpreter, jobs=1, optimize=None, batch_window=BATCH_WINDOW):
+        self.definitions = definitions
+        self.create = create
+        self.jobs = jobs
+        self.optimize = optimize
+        self.batch_window = batch_window
+        self.pool = self.start_pool()
+        self.pending = []  # (statement, future) waiting for the next batch
+        self.flush_handle = None
+
+    def start_pool(self):
+        return ProcessPoolExecutor(self.jobs, initializer=load_worker, initargs=(self.create, self.definitions))
+
+    def restart_pool(self, broken):
+        """Replace a pool that lost a worker, which fails every later task, unless that was already done."""
+        if self.pool is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.pool = self.start_pool()
+        self.warm_up()
+
+    def warm_up(self):
+        """Start every worker and load the library before the first request comes in."""
+        futures = [self.pool.submit(evaluate_batch, len(self.definitions), []) for _ in range(self.jobs)]
+        for future in futures:
+            future.result()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def parse_request(self, request):
+        if not isinstance(request, dict) or not isinstance(request.get('expr'), str):
+            raise RequestError("Request must be an object with an 'expr' string")
+        statements = Parser(Lexer(request['expr'])).parse()
+        if len(statements) != 1:
+            raise RequestError(f"Expected exactly one expression, got {len(statements)}")
+        if not is_independent(statements[0]):
+            raise RequestError("Function definitions are not accepted by the server")
+        if self.optimize is not None:
+            statements = self.optimize(statements)
+        return statements[0]
+
+    async def evaluate(self, statement):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((statement, future))
+        if len(self.pending) >= MAX_BATCH:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        pending, self.pending = self.pending, []
+        loop = asyncio.get_running_loop()
+        # One share of the batch per worker
+        size = math.ceil(len(pending) / self.jobs)
+        for start in range(0, len(pending), size):
+            chunk = pending[start:start + size]
+            statements = [statement for statement, _ in chunk]
+            pool = self.pool
+            try:
+                task = loop.run_in_executor(pool, evaluate_batch, len(self.definitions), statements)
+            except BrokenProcessPool:
+                self.restart_pool(pool)
+                pool = self.pool
+                task = loop.run_in_executor(pool, evaluate_batch, len(self.definitions), statements)
+            task.add_done_callback(partial(self.deliver, pool, chunk))
+
+    def deliver(self, pool, chunk, task):
+        broken = False
+        try:
+            outcomes = task.result()
+        except Exception as e:
+            broken = isinstance(e, BrokenProcessPool)
+            outcomes = [('err', f"Worker failed: {e}")] * len(chunk)
+        for (_, future), outcome in zip(chunk, outcomes):
+            if not future.done():
+                future.set_result(outcome)
+        if broken:
+            # The requests that were running are lost, but later ones go to new workers
+            self.restart_pool(pool)
+
+    async def respond(self, line, writer):
+        start = time.perf_counter()
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise RequestError("Invalid JSON request")
+            if isinstance(request, dict):
+                request_id = request.get('id')
+            status, value = await self.evaluate(self.parse_request(request))
+        except Exception as e:
+            status, value = 'err', str(e)
+        response = {'id': request_id, 'ok': status == 'ok'}
+        response['result' if status == 'ok' else 'error'] = value
+        response['latency_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        writer.write(json.dumps(response, default=str).encode() + b'\n')
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass  # the client went away; handle_connection closes the connection
+
+    async def handle_connection(self, reader, writer):
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self.respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                # Stop reading requests while a client sends them faster than they are
+                # answered, or while answers pile up unsent because it does not read them
+                if len(tasks) >= MAX_IN_FLIGHT:
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                await writer.drain()
+            if tasks:
+                await asyncio.wait(tasks)
+        except (ConnectionError, ValueError):
+            pass  # client went away, or sent a line longer than MAX_LINE
+        finally:
+            writer.close()
+
+    async def serve(self, port, socket_path=None):
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, socket_path, limit=MAX_LINE)
+            address = socket_path
+        else:
+            server = await asyncio.start_server(self.handle_connection, '127.0.0.1', port, limit=MAX_LINE)
+            address = f"127.0.0.1:{port}"
+        print(f"Serving {len(self.definitions)} functions on {address} with {self.jobs} worker(s)", flush=True)
+        async with server:
+            await server.serve_forever()
+
+
+def load_library(filename, optimize=None):
+    """Return the function definitions of a .lambda file; its other statements are ignored."""
+    if filename is None:
+        return []
+    with open(filename, 'r') as file:
+        statements = load_program(filename, file.read())
+    if optimize is not None:
+        statements = optimize(statements)
+    # After optimizing, since inlining puts new variables into function bodies
+    Interpreter().resolve(statements)
+    return [statement for statement in statements if type(statement) is FunctionDef]
+
+
+def run_server(library, port, create=Interpreter, jobs=1, socket_path=None, optimize=None):
+    try:
+        definitions = load_library(library, optimize)
+    except FileNotFoundError:
+        print(f"File not found: {library}")
+        return
+    except Exception as e:
+        print(f"Error loading library: {e}")
+        return
+
+    # Requests are optimized one at a time, without inlining
+    request_optimize = None if optimize is None else partial(optimize, inline_functions=False)
+    server = EvaluationServer(definitions, create, jobs, request_optimize)
+    try:
+        server.warm_up()
+        asyncio.run(server.serve(port, socket_path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,106 @@
+from interpreter import Environment, Interpreter
+from operators import PREFIX_OPERATORS, SHORT_CIRCUIT, STRICT_OPERATORS
+from parserR import (Number, Boolean, Variable, BinaryOp, UnaryOp, IfElse, FunctionCall, FunctionDef,
+                     LambdaExpression)
+
+# Work items on the continuation stack
+EVAL = 0        # evaluate the node and push its value
+APPLY = 1       # pop two operands and push the result of a strict binary operator
+SHORT = 2       # pop the left operand of '&&'/'||' and maybe evaluate the right one
+UNARY = 3       # pop a value and push the result of a prefix operator
+BRANCH = 4      # pop a condition and evaluate the matching if/else branch
+CALL = 5        # pop the arguments and enter the body in a new frame
+RETURN = 6      # restore the caller's frame
+
+
+class StackInterpreter(Interpreter):
+    """Interpreter whose evaluation state lives in heap lists instead of the Python stack.
+
+    visit() keeps a stack of pending work items and a stack of computed values,
+    so the depth of recursion in a program is limited only by memory. A call
+    made right before its caller returns does not push another RETURN, which
+    also keeps tail recursion in constant space.
+    """
+
+    def visit(self, node):
+        frame = self.frame
+        todo = [(EVAL, node)]
+        values = []
+        push, pop = todo.append, todo.pop
+
+        while todo:
+            action, item = pop()
+            if action == EVAL:
+                node_type = type(item)
+                if node_type is Number or node_type is Boolean:
+                    values.append(item.value)
+                elif node_type is Variable:
+                    depth = item.depth
+                    if depth is None:
+                        values.append(self.visit_Variable(item))
+                    else:
+                        scope = frame
+                        for _ in range(depth):
+                            scope = scope.parent
+                        values.append(scope.vars[item.slot])
+                elif node_type is BinaryOp:
+                    op_type = item.op.type
+                    function = STRICT_OPERATORS.get(op_type)
+                    if function is not None:
+                        push((APPLY, function))
+                        push((EVAL, item.right))
+                    elif op_type in SHORT_CIRCUIT:
+                        push((SHORT, item))
+                    else:
+                        raise Exception(f'Invalid operator {item.op}')
+                    push((EVAL, item.left))
+                elif node_type is IfElse:
+                    push((BRANCH, item))
+                    push((EVAL, item.condition))
+                elif node_type is FunctionCall:
+                    func = self.lookup_function(item)
+                    push((CALL, (func.body, len(item.arguments), False)))
+                    for arg in reversed(item.arguments):
+                        push((EVAL, arg))
+                elif node_type is LambdaExpression:
+                    push((CALL, (item.body, len(item.args), True)))
+                    for arg in reversed(item.args):
+                        push((EVAL, arg))
+                elif node_type is UnaryOp:
+                    if item.op.type not in PREFIX_OPERATORS:
+                        raise Exception(f'Invalid operator {item.op}')
+                    push((UNARY, PREFIX_OPERATORS[item.op.type].function))
+                    push((EVAL, item.expr))
+                elif node_type is FunctionDef:
+                    values.append(self.visit_FunctionDef(item))
+                else:
+                    raise Exception(f'No visit_{node_type.__name__} method defined')
+            elif action == APPLY:
+                right = values.pop()
+                values[-1] = item(values[-1], right)
+            elif action == SHORT:
+                left = values[-1]
+                if SHORT_CIRCUIT[item.op.type] != bool(left):
+                    values.pop()
+                    push((EVAL, item.right))
+            elif action == BRANCH:
+                if values.pop():
+                    push((EVAL, item.if_branch))
+                elif item.else_branch is not None:
+                    push((EVAL, item.else_branch))
+                else:
+                    values.append(None)
+            elif action == CALL:
+                body, argc, is_lambda = item
+                args = values[len(values) - argc:]
+                del values[len(values) - argc:]
+                if not todo or todo[-1][0] != RETURN:
+                    push((RETURN, frame))
+                frame = Environment(args, frame if is_lambda else None)
+                push((EVAL, body))
+            elif action == RETURN:
+                frame = item
+            elif action == UNARY:
+                values[-1] = item(values[-1])
+
+        return values.pop()
@@ -0,0 +1,155 @@
+from interpreter import Environment, Interpreter
+from operators import OPERATORS
+from parserR import FunctionDef, NodeVisitor
+
+def param_names(params):
+    # Python rejects repeated parameter names; the last one wins, as in the interpreter
+    names = []
+    for i, param in enumerate(params):
+        names.append(f'v_{param}' if param not in params[i + 1:] else f'_shadowed{i}')
+    return ', '.join(names)
+
+
+class PythonTranspiler(NodeVisitor):
+    """Translates AST nodes into equivalent Python expression source.
+
+    Language variables become Python locals prefixed with 'v_', lambdas become
+    immediately called Python lambdas and function calls go through the '_fn'
+    table of the running TranspilingInterpreter, so redefinitions are seen.
+    Operators become their Python equivalents from operators.py, or a call
+    through the '_operators' table for those that have none.
+    """
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+
+    def operator(self, node, arity):
+        op = OPERATORS.get(node.op.type)
+        if op is None or op.arity != arity:
+            raise Exception(f'Invalid operator {node.op}')
+        return op
+
+    def visit_BinaryOp(self, node):
+        op = self.operator(node, 2)
+        left, right = self.visit(node.left), self.visit(node.right)
+        if op.python is not None:
+            return f'({left} {op.python} {right})'
+        if op.short_circuit is not None:
+            # '(not _l) != stop' is 'bool(_l) == stop' without needing builtins
+            return f'(lambda _l: _l if (not _l) != {op.short_circuit!r} else {right})({left})'
+        return f'_operators[{op.token_type.name!r}]({left}, {right})'
+
+    def visit_UnaryOp(self, node):
+        op = self.operator(node, 1)
+        if op.python is not None:
+            return f'({op.python} {self.visit(node.expr)})'
+        return f'_operators[{op.token_type.name!r}]({self.visit(node.expr)})'
+
+    def visit_Number(self, node):
+        return f'({node.value!r})'
+
+    def visit_Boolean(self, node):
+        return repr(node.value)
+
+    def visit_Variable(self, node):
+        if node.depth is None:
+            return f'_global({str(node.name)!r})'
+        return f'v_{node.name}'
+
+    def visit_FunctionDef(self, node):
+        return f'_define({self.interpreter.register(node)})'
+
+    def visit_IfElse(self, node):
+        else_branch = 'None' if node.else_branch is None else self.visit(node.else_branch)
+        return f'({self.visit(node.if_branch)} if {self.visit(node.condition)} else {else_branch})'
+
+    def visit_FunctionCall(self, node):
+        args = ', '.join(self.visit(arg) for arg in node.arguments)
+        key = (node.name, len(node.arguments))
+        return f'(_fn.get({key!r}) or _lookup{key!r})({args})'
+
+    def visit_LambdaExpression(self, node):
+        args = ', '.join(self.visit(arg) for arg in node.args)
+        return f'(lambda {param_names(node.params)}: {self.visit(node.body)})({args})'
+
+    def function_source(self, node):
+        return f'def f_{node.name}({param_names(node.arguments)}):\n    return {self.visit(node.body)}\n'
+
+
+class TranspilingInterpreter(Interpreter):
+    """Interpreter that runs statements as Python code generated from the AST.
+
+    Each function body is translated to a Python def on its first call, so
+    CPython's own bytecode loop does the work. Code too deeply nested for the
+    Python compiler falls back to the tree-walking interpreter.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.transpiler = PythonTranspiler(self)
+        self.functions = {}  # FunctionDef -> Python function
+        self.fast_calls = {}  # (name, argc) -> Python function, cleared on every definition
+        self.definitions = []  # FunctionDef nodes referenced from generated code
+        self.fallback = Interpreter()
+        self.fallback.env = self.env
+        self.namespace = {
+            '__builtins__': {},
+            '_fn': self.fast_calls,
+            '_lookup': self.lookup,
+            '_global': self.load_global,
+            '_define': self.define,
+            '_operators': {token_type.name: op.function for token_type, op in OPERATORS.items()},
+        }
+
+    def register(self, node):
+        self.definitions.append(node)
+        return len(self.definitions) - 1
+
+    def define(self, index):
+        return self.visit_FunctionDef(self.definitions[index])
+
+    def visit_FunctionDef(self, node):
+        self.functions.pop(self.env.get(node.name), None)
+        self.fast_calls.clear()
+        return super().visit_FunctionDef(node)
+
+    def load_global(self, name):
+        if name not in self.env:
+            raise Exception(f"Variable '{name}' is not defined")
+        return self.env[name]
+
+    def lookup(self, name, argc):
+        func = self.env.get(name)
+        if not func:
+            raise Exception(f"Function '{name}' is not defined")
+        if not isinstance(func, FunctionDef):
+            raise Exception(f"'{name}' is not a function")
+        if argc != len(func.arguments):
+            raise Exception(f"Function '{name}' expects {len(func.arguments)} arguments, but got {argc}")
+        function = self.functions.get(func)
+        if function is None:
+            function = self.functions[func] = self.compile_function(func)
+        self.fast_calls[(name, argc)] = function
+        return function
+
+    def call_function(self, func, args):
+        return self.lookup(func.name, len(args))(*args)
+
+    def compile_function(self, func):
+        try:
+            code = compile(self.transpiler.function_source(func), '<lambda program>', 'exec')
+        except (SyntaxError, RecursionError, MemoryError):
+            return lambda *args: self.fallback.call_in_frame(func.body, Environment(list(args)))
+        scope = {}
+        exec(code, self.namespace, scope)
+        return scope[f'f_{func.name}']
+
+    def visit(self, node):
+        if isinstance(node, FunctionDef):
+            return self.visit_FunctionDef(node)
+        try:
+            # Top-level statements run once, so their code is not kept
+            code = compile(self.transpiler.visit(node), '<lambda program>', 'eval')
+        except (SyntaxError, RecursionError, MemoryError):
+            return self.fallback.visit(node)
+        return eval(code, self.namespace)
@@ -0,0 +1,205 @@
+import operator
+
+from operators import PREFIX_OPERATORS, SHORT_CIRCUIT, STRICT_OPERATORS
+from parserR import NodeVisitor
+
+INT64_MAX = 2 ** 63 - 1
+
+# Built-in comparison functions, which work on NumPy arrays as they are
+COMPARISONS = {operator.eq, operator.ne, operator.gt, operator.lt, operator.ge, operator.le}
+
+_numpy = None  # the numpy module once imported, False if it is not installed
+
+
+def load_numpy():
+    """Return the numpy module, or None when it is not installed. NumPy is only imported when first needed."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+class NotVectorizable(Exception):
+    """The body, or the values it would compute, cannot be evaluated exactly with int64 arrays."""
+
+
+class Vector:
+    """A compiled expression: evaluate(columns) returns its values for every row.
+
+    kind is 'int' or 'bool', and every value lies between low and high.
+    """
+    __slots__ = ('evaluate', 'kind', 'low', 'high')
+
+    def __init__(self, evaluate, kind, low, high):
+        if low < -INT64_MAX or high > INT64_MAX:
+            raise NotVectorizable("Values may not fit in 64 bits")
+        self.evaluate = evaluate
+        self.kind = kind
+        self.low = low
+        self.high = high
+
+
+class VectorCompiler(NodeVisitor):
+    """Compiles a function body into NumPy operations over whole columns of arguments.
+
+    Only bodies made of numbers, booleans, parameters, operators registered
+    with their built-in functions and if/else with both branches are
+    accepted. Each value's range is worked out from the ranges of the
+    columns, so a body whose integers could leave int64, where Python would
+    go on with big integers, is refused before anything runs.
+    Both operands of '&&' and '||' and both branches of an if/else are
+    computed for every row, and the results picked with numpy.where.
+    Evaluation raises NotVectorizable where that would divide by zero, since
+    the interpreter might not have evaluated that operand.
+    """
+
+    def __init__(self, np, columns, bounds):
+        self.np = np
+        self.columns = columns
+        self.bounds = bounds  # (lowest, highest) value of each column
+
+    def compile(self, body):
+        return self.visit(body)
+
+    def as_int(self, vector):
+        # NumPy adds and multiplies booleans as logical or/and; Python treats them as 0 and 1
+        if vector.kind == 'int':
+            return vector.evaluate
+        evaluate, int64 = vector.evaluate, self.np.int64
+        return lambda columns: evaluate(columns).astype(int64)
+
+    def truth(self, vector):
+        if vector.kind == 'bool':
+            return vector.evaluate
+        evaluate = vector.evaluate
+        return lambda columns: evaluate(columns) != 0
+
+    def visit_Number(self, node):
+        vector = Vector(None, 'int', node.value, node.value)
+        value = self.np.int64(node.value)
+        vector.evaluate = lambda columns: value
+        return vector
+
+    def visit_Boolean(self, node):
+        value = self.np.bool_(node.value)
+        return Vector(lambda columns: value, 'bool', int(node.value), int(node.value))
+
+    def visit_Variable(self, node):
+        if node.depth != 0:
+            raise NotVectorizable(f"'{node.name}' is not a parameter")
+        slot = node.slot
+        kind = 'bool' if self.columns[slot].dtype == bool else 'int'
+        return Vector(lambda columns: columns[slot], kind, *self.bounds[slot])
+
+    def visit_UnaryOp(self, node):
+        op = PREFIX_OPERATORS.get(node.op.type)
+        if op is None or op.function is not operator.not_:
+            raise NotVectorizable(f'Invalid operator {node.op}')
+        truth, logical_not = self.truth(self.visit(node.expr)), self.np.logical_not
+        return Vector(lambda columns: logical_not(truth(columns)), 'bool', 0, 1)
+
+    def visit_BinaryOp(self, node):
+        np = self.np
+        op = node.op.type
+        left, right = self.visit(node.left), self.visit(node.right)
+        if op in SHORT_CIRCUIT:
+            if left.kind != right.kind:
+                raise NotVectorizable("'&&' and '||' between a number and a boolean")
+            left_truth, left_value, right_value = self.truth(left), left.evaluate, right.evaluate
+            if SHORT_CIRCUIT[op]:
+                evaluate = lambda columns: np.where(left_truth(columns), left_value(columns), right_value(columns))
+            else:
+                evaluate = lambda columns: np.where(left_truth(columns), right_value(columns), left_value(columns))
+            return Vector(evaluate, left.kind, min(left.low, right.low), max(left.high, right.high))
+
+        function = STRICT_OPERATORS.get(op)
+        if function in COMPARISONS:
+            left_value, right_value = left.evaluate, right.evaluate
+            return Vector(lambda columns: function(left_value(columns), right_value(columns)), 'bool', 0, 1)
+
+        a, b = self.as_int(left), self.as_int(right)
+        if function is operator.add:
+            return Vector(lambda columns: a(columns) + b(columns), 'int', left.low + right.low, left.high + right.high)
+        if function is operator.sub:
+            return Vector(lambda columns: a(columns) - b(columns), 'int', left.low - right.high, left.high - right.low)
+        if function is operator.mul:
+            corners = [x * y for x in (left.low, left.high) for y in (right.low, right.high)]
+            return Vector(lambda columns: a(columns) * b(columns), 'int', min(corners), max(corners))
+        if function is operator.floordiv or function is operator.mod:
+            operation = np.floor_divide if function is operator.floordiv else np.mod  # both round like Python
+
+            def evaluate(columns):
+                divisor = b(columns)
+                if np.any(divisor == 0):
+                    raise NotVectorizable("Division by zero")
+                return operation(a(columns), divisor)
+
+            # |x // y| <= |x| and |x % y| < |y| for any nonzero y
+            bound = max(-left.low, left.high) if function is operator.floordiv else max(-right.low, right.high)
+            return Vector(evaluate, 'int', -bound, bound)
+        raise NotVectorizable(f'Invalid operator {node.op}')
+
+    def visit_IfElse(self, node):
+        if node.else_branch is None:
+            raise NotVectorizable("if without else")
+        condition = self.truth(self.visit(node.condition))
+        if_branch, else_branch = self.visit(node.if_branch), self.visit(node.else_branch)
+        if if_branch.kind != else_branch.kind:
+            raise NotVectorizable("Branches of different types")
+        where, if_value, else_value = self.np.where, if_branch.evaluate, else_branch.evaluate
+        return Vector(lambda columns: where(condition(columns), if_value(columns), else_value(columns)),
+                      if_branch.kind, min(if_branch.low, else_branch.low), max(if_branch.high, else_branch.high))
+
+    def refuse(self, node):
+        raise NotVectorizable(f"{type(node).__name__} cannot be vectorized")
+
+    visit_FunctionCall = visit_FunctionDef = visit_LambdaExpression = refuse
+
+
+def integer_columns(np, columns):
+    """Return the non-empty columns as int64 or bool arrays and their bounds, or None if one holds other values."""
+    arrays, bounds = [], []
+    for column in columns:
+        array = np.asarray(column)
+        if array.dtype.kind not in 'biu' or array.size == 0:
+            return None
+        low, high = int(array.min()), int(array.max())
+        if low < -INT64_MAX or high > INT64_MAX:
+            return None
+        arrays.append(array if array.dtype == bool else array.astype(np.int64, copy=False))
+        bounds.append((low, high))
+    return arrays, bounds
+
+
+def vectorized(np, func, columns, length):
+    """Return func applied to every row of the integer columns as one array, or None if that is not exact."""
+    converted = integer_columns(np, columns)
+    if converted is None:
+        return None
+    arrays, bounds = converted
+    try:
+        vector = VectorCompiler(np, arrays, bounds).compile(func.body)
+        with np.errstate(all='ignore'):
+            result = vector.evaluate(arrays)
+    except NotVectorizable:
+        return None
+    return np.broadcast_to(result, (length,)).copy()
+
+
+def to_array(np, values):
+    """Turn the per-row results of the fallback loop into an array, as exactly as their types allow."""
+    types = set(map(type, values))
+    if types == {bool}:
+        return np.array(values, dtype=bool)
+    if types == {int}:
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            pass
+    result = np.empty(len(values), dtype=object)
+    result[:] = values
+    return result